@@ -1,3 +1,112 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
 from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from ecommerce.models import Order
+from investments.models import Transaction
+
+
+class AllTransactionsTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.admin = User.objects.create_superuser(email='admin@example.com', password='pass')
+        self.user = User.objects.create_user(email='bo@example.com', password='pass', first_name='Bo')
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+        now = timezone.now()
+        investment_tx = Transaction.objects.create(
+            user=self.user, transaction_type='investment', amount=Decimal('5')
+        )
+        older_order = Order.objects.create(
+            user=self.user, reference='ord-old', email='bo@example.com', total_amount=Decimal('3')
+        )
+        newer_order = Order.objects.create(
+            user=None, reference='ord-new', email='guest@example.com', total_amount=Decimal('4')
+        )
+        # auto_now_add ignores explicit values, so pin the timestamps afterwards
+        Order.objects.filter(pk=older_order.pk).update(created_at=now - timedelta(hours=2))
+        Transaction.objects.filter(pk=investment_tx.pk).update(created_at=now - timedelta(hours=1))
+        Order.objects.filter(pk=newer_order.pk).update(created_at=now)
+        self.expected_ids = [f'ORD-{newer_order.pk}', f'INV-{investment_tx.pk}', f'ORD-{older_order.pk}']
+
+    def test_merges_all_sources_newest_first(self):
+        response = self.client.get('/api/admin/all-transactions/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['id'] for row in response.data], self.expected_ids)
+        self.assertEqual(
+            [row['type'] for row in response.data], ['E-commerce', 'Investment', 'E-commerce']
+        )
+
+    def test_user_falls_back_to_email_without_a_name(self):
+        response = self.client.get('/api/admin/all-transactions/')
+
+        self.assertEqual(response.data[1]['user'], 'Bo')
+        self.assertEqual(response.data[1]['email'], 'bo@example.com')
+        # Guest order: no linked user, so no name and no user email
+        self.assertIsNone(response.data[0]['user'])
+        self.assertEqual(response.data[0]['email'], 'guest@example.com')
+
+    def test_offset_and_limit_slice_the_merged_stream(self):
+        response = self.client.get('/api/admin/all-transactions/?offset=1&limit=1')
+
+        self.assertEqual([row['id'] for row in response.data], self.expected_ids[1:2])
+
+    def test_rejects_invalid_paging(self):
+        for query in ('limit=x', 'offset=-1'):
+            response = self.client.get(f'/api/admin/all-transactions/?{query}')
+            self.assertEqual(response.status_code, 400)
+
+    def test_requires_admin(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        self.assertEqual(client.get('/api/admin/all-transactions/').status_code, 403)
+
+
+class UpdateTransactionTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.admin = User.objects.create_superuser(email='admin@example.com', password='pass')
+        self.order = Order.objects.create(
+            user=self.admin, reference='ord-1', email='admin@example.com', total_amount=Decimal('3')
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def put(self, pk, data):
+        return self.client.put(f'/api/admin/transactions/{pk}/', data, format='json')
+
+    def test_updates_amount_and_status(self):
+        response = self.put(f'ORD-{self.order.pk}', {'amount': '9.50', 'status': 'paid'})
+
+        self.assertEqual(response.status_code, 200)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.total_amount, Decimal('9.50'))
+        self.assertEqual(self.order.status, 'paid')
+
+    def test_unknown_id_is_404_with_or_without_payload(self):
+        self.assertEqual(self.put('ORD-999', {'status': 'paid'}).status_code, 404)
+        self.assertEqual(self.put('ORD-999', {}).status_code, 404)
+
+    def test_empty_payload_on_existing_transaction(self):
+        response = self.put(f'ORD-{self.order.pk}', {})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'message': 'Nothing to update'})
+
+    def test_rejects_bad_input_without_writing(self):
+        self.assertEqual(self.put('XX-1', {}).status_code, 400)
+        self.assertEqual(self.put('ORD-abc', {'status': 'paid'}).status_code, 400)
+        self.assertEqual(self.put('STO-not-a-uuid', {'status': 'paid'}).status_code, 400)
+        # Order.total_amount is max_digits=10, decimal_places=2
+        for amount in ('abc', 'NaN', None, '1e30', '123456789.00', '1.005'):
+            self.assertEqual(self.put(f'ORD-{self.order.pk}', {'amount': amount}).status_code, 400)
 
-# Create your tests here.
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.total_amount, Decimal('3'))
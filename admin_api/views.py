@@ -1,3 +1,7 @@
+import heapq
+from itertools import islice
+from operator import itemgetter
+
 from django.shortcuts import render
 
 # Create your views here.
@@ -7,57 +11,96 @@ from rest_framework.response import Response
 from investments.models import Transaction as InvestmentTransaction
 from storage.models import PaymentTransaction as StorageTransaction
 from ecommerce.models import Order
-from django.utils.timezone import localtime
+from django.core.exceptions import ValidationError
+from django.core.validators import DecimalValidator
+from django.db.models import F
+from django.utils.timezone import get_current_timezone, localtime, now
 from rest_framework import status
 
+
+def _tagged_rows(queryset, prefix, label):
+    """Yield ``values()`` rows from ``queryset`` tagged with their ID prefix and type label."""
+    for row in queryset.iterator():
+        row['prefix'] = prefix
+        row['type'] = label
+        yield row
+
+
+def _format_transaction(row, tz):
+    return {
+        'id': f"{row['prefix']}-{row['id']}",
+        'type': row['type'],
+        'user': f"{row['user_first_name'] or ''} {row['user_last_name'] or ''}".strip() or row['user_email'],
+        'email': row['email'],
+        'amount': row['amount'],
+        'status': row['status'],
+        'date': localtime(row['created_at'], tz).strftime('%Y-%m-%d %H:%M'),
+    }
+
+
 @api_view(['GET'])
 @permission_classes([IsAdminUser])
 def all_transactions(request):
-    transactions = []
-
-    # Investment transactions
-    for tx in InvestmentTransaction.objects.select_related('user').all():
-        transactions.append({
-            'id': f"INV-{tx.id}",
-            'type': 'Investment',
-            'user': tx.user.get_full_name() or tx.user.username,
-            'email': tx.user.email,
-            'amount': tx.amount,
-            'status': tx.status,
-            'date': localtime(tx.created_at).strftime('%Y-%m-%d %H:%M'),
-        })
-
-    # Storage transactions
-    for tx in StorageTransaction.objects.select_related('investment__user').all():
-        transactions.append({
-            'id': f"STO-{tx.id}",
-            'type': 'Storage',
-            'user': tx.investment.user.get_full_name() or tx.investment.user.username,
-            'email': tx.investment.user.email,
-            'amount': tx.amount,
-            'status': tx.status,
-            'date': localtime(tx.created_at).strftime('%Y-%m-%d %H:%M'),
-        })
-
-    # E-commerce orders
-    for order in Order.objects.all():
-        transactions.append({
-            'id': f"ORD-{order.id}",
-            'type': 'E-commerce',
-            'user': f"{order.user.first_name} {order.user.last_name}".strip() or order.user.username,
-            'email': order.email,
-            'amount': order.total_amount,
-            'status': order.status,
-            'date': localtime(order.created_at).strftime('%Y-%m-%d %H:%M'),
-        })
-
-    # Sort by date descending
-    transactions.sort(key=lambda x: x['date'], reverse=True)
+    """
+    List investment, storage and e-commerce transactions, newest first.
+    Optional query params: ?offset=<int>&limit=<int>
+    """
+    try:
+        offset = int(request.query_params.get('offset', 0))
+        limit = request.query_params.get('limit')
+        limit = int(limit) if limit is not None else None
+        if offset < 0 or (limit is not None and limit < 0):
+            raise ValueError
+    except ValueError:
+        return Response({"error": "offset and limit must be non-negative integers"}, status=status.HTTP_400_BAD_REQUEST)
+
+    # Each source is sorted by the DB, so a k-way merge keeps the overall order
+    investment_rows = InvestmentTransaction.objects.order_by('-created_at').values(
+        'id', 'amount', 'status', 'created_at',
+        user_first_name=F('user__first_name'),
+        user_last_name=F('user__last_name'),
+        user_email=F('user__email'),
+        email=F('user__email'),
+    )
+    storage_rows = StorageTransaction.objects.order_by('-created_at').values(
+        'id', 'amount', 'status', 'created_at',
+        user_first_name=F('investment__user__first_name'),
+        user_last_name=F('investment__user__last_name'),
+        user_email=F('investment__user__email'),
+        email=F('investment__user__email'),
+    )
+    order_rows = Order.objects.order_by('-created_at').values(
+        'id', 'email', 'status', 'created_at',
+        amount=F('total_amount'),
+        user_first_name=F('user__first_name'),
+        user_last_name=F('user__last_name'),
+        user_email=F('user__email'),
+    )
+
+    merged = heapq.merge(
+        _tagged_rows(investment_rows, 'INV', 'Investment'),
+        _tagged_rows(storage_rows, 'STO', 'Storage'),
+        _tagged_rows(order_rows, 'ORD', 'E-commerce'),
+        key=itemgetter('created_at'),
+        reverse=True,
+    )
+    # Rows are merged on raw datetimes; only the returned window is formatted
+    stop = offset + limit if limit is not None else None
+    tz = get_current_timezone()
+    transactions = [_format_transaction(row, tz) for row in islice(merged, offset, stop)]
 
     return Response(transactions)
 
 
 
+# ID prefix -> (model, field the "amount" payload key maps to, label)
+TRANSACTION_HANDLERS = {
+    "INV": (InvestmentTransaction, "amount", "Investment transaction"),
+    "STO": (StorageTransaction, "amount", "Storage transaction"),
+    "ORD": (Order, "total_amount", "E-commerce order"),
+}
+
+
 @api_view(['PUT'])
 @permission_classes([IsAdminUser])
 def update_transaction(request, pk):
@@ -65,42 +108,46 @@ def update_transaction(request, pk):
     Update a transaction (investment, storage, or e-commerce) based on ID prefix.
     Expected payload: {"amount": ..., "status": "..."}
     """
+    prefix, _, tx_id = pk.partition("-")
+    handler = TRANSACTION_HANDLERS.get(prefix)
+    if handler is None:
+        return Response({"error": "Invalid transaction ID format"}, status=status.HTTP_400_BAD_REQUEST)
+    model, amount_field, label = handler
+
+    updates = {}
+    if "amount" in request.data:
+        # Validate against the target column before querying so a bad amount never reaches the database
+        field = model._meta.get_field(amount_field)
+        try:
+            amount = field.to_python(request.data["amount"])
+            if amount is None:
+                raise ValidationError("amount is required")
+            DecimalValidator(field.max_digits, field.decimal_places)(amount)
+        except ValidationError:
+            return Response(
+                {"error": f"amount must be a number with at most {field.max_digits} digits "
+                          f"and {field.decimal_places} decimal places"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        updates[amount_field] = amount
+
     try:
-        # Determine type by prefix
-        if pk.startswith("INV-"):
-            tx_id = pk.replace("INV-", "")
-            transaction = InvestmentTransaction.objects.get(id=tx_id)
-            if "amount" in request.data:
-                transaction.amount = request.data["amount"]
-            if "status" in request.data:
-                transaction.status = request.data["status"]
-            transaction.save()
-            return Response({"message": "Investment transaction updated successfully"})
-
-        elif pk.startswith("STO-"):
-            tx_id = pk.replace("STO-", "")
-            transaction = StorageTransaction.objects.get(id=tx_id)
-            if "amount" in request.data:
-                transaction.amount = request.data["amount"]
-            if "status" in request.data:
-                transaction.status = request.data["status"]
-            transaction.save()
-            return Response({"message": "Storage transaction updated successfully"})
-
-        elif pk.startswith("ORD-"):
-            tx_id = pk.replace("ORD-", "")
-            order = Order.objects.get(id=tx_id)
-            if "amount" in request.data:
-                order.total_amount = request.data["amount"]
-            if "status" in request.data:
-                order.status = request.data["status"]
-            order.save()
-            return Response({"message": "E-commerce order updated successfully"})
-
-        else:
-            return Response({"error": "Invalid transaction ID format"}, status=status.HTTP_400_BAD_REQUEST)
-
-    except (InvestmentTransaction.DoesNotExist, StorageTransaction.DoesNotExist, Order.DoesNotExist):
-        return Response({"error": "Transaction not found"}, status=status.HTTP_404_NOT_FOUND)
-    except Exception as e:
-        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        transactions = model.objects.filter(id=tx_id)
+        if "status" in request.data:
+            updates["status"] = request.data["status"]
+        if not updates:
+            if not transactions.exists():
+                return Response({"error": "Transaction not found"}, status=status.HTTP_404_NOT_FOUND)
+            return Response({"message": "Nothing to update"})
+        # update() bypasses save(), so keep auto_now timestamps current by hand
+        if hasattr(model, "updated_at"):
+            updates["updated_at"] = now()
+
+        # The row count doubles as the existence check when there is something to write
+        if not transactions.update(**updates):
+            return Response({"error": "Transaction not found"}, status=status.HTTP_404_NOT_FOUND)
+        return Response({"message": f"{label} updated successfully"})
+
+    except (ValidationError, ValueError):
+        # Malformed ID for the model's primary key type (int or UUID)
+        return Response({"error": "Invalid transaction ID format"}, status=status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.2 on 2026-10-15 14:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecommerce', '0005_alter_product_image'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['is_active'], name='product_active_partial'),
+        ),
+    ]
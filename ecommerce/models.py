@@ -17,6 +17,12 @@ class Product(models.Model):
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Storefront listings only ever read active products
+            models.Index(fields=['is_active'], condition=models.Q(is_active=True), name='product_active_partial'),
+        ]
+
 
 class Order(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
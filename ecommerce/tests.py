@@ -1,3 +1,217 @@
+import hashlib
+import hmac
+import json
+from decimal import Decimal
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
 from django.test import TestCase
+from rest_framework.test import APIClient
+
+from .models import Cart, CartItem, Order, OrderItem, Product
+
+
+def paystack_response(status_code=200, **data):
+    response = mock.Mock(status_code=status_code)
+    response.json.return_value = {'data': data}
+    return response
+
+
+class EcommerceTestCase(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(email='buyer@example.com', password='pass')
+        self.product = Product.objects.create(
+            name='Maize', description='Bag of maize', price=Decimal('2.00'), stock=5
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+
+class VerifyPaymentTests(EcommerceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.order = Order.objects.create(
+            user=self.user, reference='order_ref', email='buyer@example.com', total_amount=Decimal('6')
+        )
+        # Two lines for the same product decrement cumulatively
+        OrderItem.objects.create(order=self.order, product=self.product, quantity=1, price=Decimal('2'))
+        OrderItem.objects.create(order=self.order, product=self.product, quantity=2, price=Decimal('2'))
+
+    def verify(self, status='success'):
+        with mock.patch('ecommerce.views.PAYSTACK') as paystack:
+            paystack.get.return_value = paystack_response(status=status, reference='order_ref')
+            return self.client.post('/api/payments/verify/', {'reference': 'order_ref'}, format='json')
+
+    def test_success_marks_order_paid_and_takes_stock(self):
+        response = self.verify()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], 'success')
+        self.order.refresh_from_db()
+        self.product.refresh_from_db()
+        self.assertEqual(self.order.status, 'paid')
+        self.assertEqual(self.product.stock, 2)
+
+    def test_repeated_verify_takes_stock_once(self):
+        self.verify()
+        self.verify()
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 2)
+
+    def test_line_exceeding_stock_is_skipped(self):
+        Product.objects.filter(pk=self.product.pk).update(stock=1)
+
+        self.verify()
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 0)
+
+    def test_failed_payment_cancels_order_without_touching_stock(self):
+        response = self.verify(status='failed')
+
+        self.assertEqual(response.data['status'], 'failed')
+        self.order.refresh_from_db()
+        self.product.refresh_from_db()
+        self.assertEqual(self.order.status, 'cancelled')
+        self.assertEqual(self.product.stock, 5)
+
+    def test_clears_the_cart(self):
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product=self.product, quantity=1)
+
+        self.verify()
+
+        self.assertFalse(CartItem.objects.filter(cart=cart).exists())
+
+
+class PaystackWebhookTests(EcommerceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.order = Order.objects.create(
+            user=self.user, reference='order_ref', email='buyer@example.com', total_amount=Decimal('2')
+        )
+        self.body = json.dumps({'event': 'charge.success', 'data': {'reference': 'order_ref'}}).encode()
+
+    def post(self, signature):
+        return self.client.post(
+            '/api/payments/webhook/', self.body,
+            content_type='application/json', HTTP_X_PAYSTACK_SIGNATURE=signature
+        )
+
+    def test_valid_signature_confirms_order(self):
+        signature = hmac.new(settings.PAYSTACK_SECRET_KEY.encode(), self.body, hashlib.sha512).hexdigest()
+
+        response = self.post(signature)
+
+        self.assertEqual(response.status_code, 200)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'confirmed')
+
+    def test_invalid_signatures_are_rejected(self):
+        for signature in ('0' * 128, 'not-hex-é'):
+            response = self.post(signature)
+            self.assertEqual(response.status_code, 400)
+
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'pending')
+
+
+class CartItemTests(EcommerceTestCase):
+    def add(self, quantity, product_id=None):
+        return self.client.post(
+            '/api/cart/items/', {'product_id': product_id or self.product.pk, 'quantity': quantity}, format='json'
+        )
+
+    def test_adding_twice_accumulates_quantity(self):
+        self.assertEqual(self.add(2).status_code, 201)
+        response = self.add(2)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['items'][0]['quantity'], 4)
+
+    def test_rejects_quantities_beyond_stock(self):
+        self.add(4)
+        response = self.add(2)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(CartItem.objects.get().quantity, 4)
+
+    def test_unknown_product_is_404(self):
+        self.assertEqual(self.add(1, product_id=999).status_code, 404)
+
+    def test_rejected_write_is_a_client_error(self):
+        # PositiveIntegerField's CHECK constraint rejects the insert
+        response = self.add(-1)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(CartItem.objects.exists())
+
+
+class CartListTests(EcommerceTestCase):
+    def test_empty_cart_without_creating_one(self):
+        response = self.client.get('/api/cart/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['items'], [])
+        self.assertFalse(Cart.objects.exists())
+
+    def test_items_and_products_load_in_fixed_queries(self):
+        cart = Cart.objects.create(user=self.user)
+        for index in range(3):
+            product = Product.objects.create(
+                name=f'Product {index}', description='d', price=Decimal('1.00'), stock=5
+            )
+            CartItem.objects.create(cart=cart, product=product, quantity=index + 1)
+
+        # Cart, then items joined to their products
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/cart/')
+
+        self.assertEqual(sorted(item['quantity'] for item in response.data['items']), [1, 2, 3])
+
+
+class InitializePaymentTests(EcommerceTestCase):
+    checkout = {
+        'email': 'buyer@example.com', 'first_name': 'Ada', 'last_name': 'Obi',
+        'address': '1 Farm Road', 'city': 'Jos', 'state': 'Plateau', 'amount': '6',
+    }
+
+    def initialize(self, cart_items):
+        with mock.patch('ecommerce.views.PAYSTACK') as paystack:
+            paystack.post.return_value = paystack_response(authorization_url='https://pay', access_code='code')
+            return self.client.post(
+                '/api/payments/initialize/', dict(self.checkout, cart_items=cart_items), format='json'
+            )
+
+    def test_creates_order_with_all_lines(self):
+        response = self.initialize([
+            {'product_id': self.product.pk, 'quantity': 1, 'price': 2},
+            {'product_id': str(self.product.pk), 'quantity': 2, 'price': '2.00'},
+        ])
+
+        self.assertEqual(response.status_code, 200)
+        order = Order.objects.get(reference=response.data['reference'])
+        self.assertEqual(
+            sorted(order.items.values_list('quantity', 'price')), [(1, Decimal('2')), (2, Decimal('2'))]
+        )
+
+    def test_malformed_line_writes_nothing(self):
+        for bad_line in (
+            {'product_id': self.product.pk, 'quantity': 1, 'price': 'zz'},
+            {'product_id': self.product.pk, 'quantity': 'x', 'price': 2},
+            {'quantity': 1, 'price': 2},
+            {'product_id': 'abc', 'quantity': 1, 'price': 2},
+            {'product_id': None, 'quantity': 1, 'price': 2},
+        ):
+            response = self.initialize([{'product_id': self.product.pk, 'quantity': 1, 'price': 2}, bad_line])
+            self.assertEqual(response.status_code, 400)
+
+        self.assertFalse(Order.objects.exists())
+
+    def test_unknown_product_writes_nothing(self):
+        response = self.initialize([{'product_id': 999, 'quantity': 1, 'price': 2}])
 
-# Create your tests here.
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
@@ -1,22 +1,45 @@
-from rest_framework import viewsets
-from .models import Product, Order, Cart, CartItem, OrderItem
-from .serializers import ProductSerializer, OrderSerializer, CartSerializer, CartItemSerializer
-from rest_framework.permissions import IsAuthenticatedOrReadOnly
-
-from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
-from rest_framework.views import APIView
+import hashlib
+import hmac
+import secrets
+from decimal import Decimal, InvalidOperation
 
 import requests
-import secrets
-from decimal import Decimal
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
 from django.conf import settings
-from django.http import JsonResponse
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.db.models import F, Prefetch
 from django.views.decorators.csrf import csrf_exempt
+from django.utils import timezone
 from django.utils.decorators import method_decorator
+from rest_framework import status, viewsets
+from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly
 from rest_framework.response import Response
-from rest_framework import status
+from rest_framework.views import APIView
+
+from .models import Product, Order, Cart, CartItem, OrderItem
+from .serializers import ProductSerializer, OrderSerializer, CartSerializer, CartItemSerializer
+
 
+# Upper bound on how long a worker waits on api.paystack.co (seconds)
+PAYSTACK_TIMEOUT = 10
+
+# Webhook signing key, encoded once rather than on every request
+PAYSTACK_SECRET = getattr(settings, 'PAYSTACK_SECRET_KEY', '').encode('utf-8')
+
+# Shared keep-alive session so checkout calls reuse pooled TCP/TLS connections
+PAYSTACK = requests.Session()
+PAYSTACK.mount('https://', HTTPAdapter(
+    pool_connections=10,
+    pool_maxsize=50,
+    max_retries=Retry(total=3, backoff_factor=0.2, status_forcelist=[502, 503, 504]),
+))
+PAYSTACK.headers.update({
+    'Authorization': f"Bearer {getattr(settings, 'PAYSTACK_SECRET_KEY', '')}",
+    'Content-Type': 'application/json',
+})
 
 
 # Create your views here.
@@ -58,11 +81,21 @@ class OrderViewSet(viewsets.ModelViewSet):
         serializer.save()
         return Response(serializer.data)
 
+def _cart_qs(user):
+    """Cart queryset with items and their products loaded for CartSerializer."""
+    return Cart.objects.filter(user=user).prefetch_related(
+        Prefetch('items', queryset=CartItem.objects.select_related('product'))
+    )
+
+
 class CartViewSet(viewsets.ViewSet):
     permission_classes = [IsAuthenticated]
 
     def list(self, request):
-        cart, _ = Cart.objects.get_or_create(user=request.user)
+        # Carts are created lazily on first add (CartItemView.post)
+        cart = _cart_qs(request.user).first()
+        if cart is None:
+            return Response({'id': None, 'user': request.user.id, 'items': [], 'updated_at': None})
         serializer = CartSerializer(cart)
         return Response(serializer.data)
 
@@ -74,39 +107,41 @@ class CartItemView(APIView):
         product_id = request.data.get('product_id')
         quantity = int(request.data.get('quantity', 1))
 
-        # Get product and validate existence
-        try:
-            product = Product.objects.get(id=product_id, is_active=True)
-        except Product.DoesNotExist:
-            return Response({'error': 'Product not found'}, status=status.HTTP_404_NOT_FOUND)
-
-        # Stock check
-        if quantity > product.stock:
-            return Response(
-                {'error': f'Only {product.stock} units available in stock.'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
+        # Lock the product row so concurrent adds validate against the same stock
+        with transaction.atomic():
+            product = Product.objects.select_for_update().filter(id=product_id, is_active=True).first()
+            if product is None:
+                return Response({'error': 'Product not found'}, status=status.HTTP_404_NOT_FOUND)
 
-        cart, _ = Cart.objects.get_or_create(user=request.user)
+            # Stock check
+            if quantity > product.stock:
+                return Response(
+                    {'error': f'Only {product.stock} units available in stock.'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
 
-        try:
-            cart_item, created = CartItem.objects.get_or_create(cart=cart, product=product)
-            if not created:
-                new_quantity = cart_item.quantity + quantity
-                if new_quantity > product.stock:
-                    return Response(
-                        {'error': f'Only {product.stock} units available in stock.'},
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-                cart_item.quantity = new_quantity
-            else:
-                cart_item.quantity = quantity
-
-            cart_item.save()
-
-        except Exception as e:
-            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            cart, _ = Cart.objects.get_or_create(user=request.user)
 
+            try:
+                # Savepoint, so a rejected write leaves the outer transaction usable
+                with transaction.atomic():
+                    cart_item, created = CartItem.objects.get_or_create(
+                        cart=cart, product=product, defaults={'quantity': quantity}
+                    )
+                    if not created:
+                        new_quantity = cart_item.quantity + quantity
+                        if new_quantity > product.stock:
+                            return Response(
+                                {'error': f'Only {product.stock} units available in stock.'},
+                                status=status.HTTP_400_BAD_REQUEST
+                            )
+                        cart_item.quantity = new_quantity
+                        cart_item.save(update_fields=['quantity'])
+
+            except (IntegrityError, ValidationError) as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        cart = _cart_qs(request.user).get()
         return Response(CartSerializer(cart).data, status=status.HTTP_201_CREATED)
 
     def delete(self, request):
@@ -141,38 +176,51 @@ class InitializePaymentView(APIView):
                     'error': 'Missing required fields: email, first_name, last_name, address, city, state are required'
                 }, status=status.HTTP_400_BAD_REQUEST)
 
+            # Parse and resolve every line up front so a bad item never leaves a partial order
+            try:
+                product_ids = [int(item_data['product_id']) for item_data in cart_items]
+                quantities = [int(item_data['quantity']) for item_data in cart_items]
+                prices = [Decimal(str(item_data['price'])) for item_data in cart_items]
+            except (KeyError, TypeError, ValueError, InvalidOperation):
+                return Response({
+                    'error': 'Each cart item requires a valid product_id, quantity and price'
+                }, status=status.HTTP_400_BAD_REQUEST)
+
+            products = Product.objects.in_bulk(product_ids)
+            for product_id in product_ids:
+                if product_id not in products:
+                    return Response({
+                        'error': f'Product with id {product_id} not found'
+                    }, status=status.HTTP_400_BAD_REQUEST)
+
             # Generate unique reference
             reference = f"order_{secrets.token_urlsafe(10)}"
 
-            # Create order
-            order = Order.objects.create(
-                reference=reference,
-                email=email,
-                first_name=first_name,
-                last_name=last_name,
-                phone=phone,
-                address=address,
-                city=city,
-                state=state,
-                total_amount=amount,
-                user=request.user if request.user.is_authenticated else None
-            )
-
-            # Create order items
-            for item_data in cart_items:
-                try:
-                    product = Product.objects.get(id=item_data['product_id'])
-                    OrderItem.objects.create(
+            with transaction.atomic():
+                # Create order
+                order = Order.objects.create(
+                    reference=reference,
+                    email=email,
+                    first_name=first_name,
+                    last_name=last_name,
+                    phone=phone,
+                    address=address,
+                    city=city,
+                    state=state,
+                    total_amount=amount,
+                    user=request.user
+                )
+
+                # Create order items
+                OrderItem.objects.bulk_create([
+                    OrderItem(
                         order=order,
-                        product=product,
-                        quantity=item_data['quantity'],
-                        price=Decimal(str(item_data['price']))
+                        product=products[product_id],
+                        quantity=quantity,
+                        price=price
                     )
-                except Product.DoesNotExist:
-                    order.delete()
-                    return Response({
-                        'error': f'Product with id {item_data["product_id"]} not found'
-                    }, status=status.HTTP_400_BAD_REQUEST)
+                    for product_id, quantity, price in zip(product_ids, quantities, prices)
+                ])
 
             # Initialize Paystack payment
             paystack_data = {
@@ -183,15 +231,10 @@ class InitializePaymentView(APIView):
                 'callback_url': f"{request.build_absolute_uri('/')[:-1]}/api/payments/callback/",
             }
 
-            headers = {
-                'Authorization': f'Bearer {settings.PAYSTACK_SECRET_KEY}',
-                'Content-Type': 'application/json',
-            }
-
-            response = requests.post(
+            response = PAYSTACK.post(
                 'https://api.paystack.co/transaction/initialize',
                 json=paystack_data,
-                headers=headers
+                timeout=PAYSTACK_TIMEOUT
             )
 
             if response.status_code == 200:
@@ -214,6 +257,8 @@ class InitializePaymentView(APIView):
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 class VerifyPaymentView(APIView):
+    permission_classes = [IsAuthenticated]
+
     def post(self, request):
         try:
             reference = request.data.get('reference')
@@ -225,54 +270,50 @@ class VerifyPaymentView(APIView):
 
             # Get order
             try:
-                order = Order.objects.get(reference=reference)
+                order_id = Order.objects.values_list('id', flat=True).get(reference=reference)
             except Order.DoesNotExist:
                 return Response({
                     'error': 'Order not found'
                 }, status=status.HTTP_404_NOT_FOUND)
 
             # Verify payment with Paystack
-            headers = {
-                'Authorization': f'Bearer {settings.PAYSTACK_SECRET_KEY}',
-                'Content-Type': 'application/json',
-            }
-
-            response = requests.get(
+            response = PAYSTACK.get(
                 f'https://api.paystack.co/transaction/verify/{reference}',
-                headers=headers
+                timeout=PAYSTACK_TIMEOUT
             )
 
             if response.status_code == 200:
                 paystack_data = response.json()
                 
                 if paystack_data['data']['status'] == 'success':
-                    # Update order status
-                    order.status = 'paid'
-                    order.paystack_reference = paystack_data['data']['reference']
-                    order.save()
-
-                    for item in order.items.all():
-                        if item.product and item.product.stock >= item.quantity:
-                            item.product.stock -= item.quantity
-                            item.product.save()
-
-                    # Clear user's cart if authenticated
-                    if request.user.is_authenticated:
-                        try:
-                            cart = Cart.objects.get(user=request.user)
-                            cart.items.all().delete()
-
-                        except Cart.DoesNotExist:
-                            pass
+                    with transaction.atomic():
+                        # Only the request that flips the order to paid goes on to take stock
+                        newly_paid = Order.objects.filter(pk=order_id).exclude(status='paid').update(
+                            status='paid',
+                            paystack_reference=paystack_data['data']['reference'],
+                            updated_at=timezone.now()
+                        )
+
+                        if newly_paid:
+                            # Decrement in the database so concurrent orders can't overwrite each other
+                            items = OrderItem.objects.filter(
+                                order_id=order_id, product__isnull=False
+                            ).values_list('product_id', 'quantity')
+                            for product_id, quantity in items:
+                                Product.objects.filter(pk=product_id, stock__gte=quantity).update(
+                                    stock=F('stock') - quantity
+                                )
+
+                    # Clear user's cart
+                    CartItem.objects.filter(cart__user=request.user).delete()
 
                     return Response({
                         'status': 'success',
                         'message': 'Payment verified successfully',
-                        'order_id': order.id
+                        'order_id': order_id
                     })
                 else:
-                    order.status = 'cancelled'
-                    order.save()
+                    Order.objects.filter(pk=order_id).update(status='cancelled', updated_at=timezone.now())
                     return Response({
                         'status': 'failed',
                         'message': 'Payment verification failed'
@@ -297,17 +338,15 @@ class PaystackWebhookView(APIView):
             signature = request.META.get('HTTP_X_PAYSTACK_SIGNATURE')
             
             if signature:
-                import hmac
-                import hashlib
-                
                 body = request.body
                 computed_signature = hmac.new(
-                    settings.PAYSTACK_SECRET_KEY.encode(),
+                    PAYSTACK_SECRET,
                     body,
                     hashlib.sha512
                 ).hexdigest()
                 
-                if signature != computed_signature:
+                # Constant-time compare; bytes so a non-ASCII header can't raise TypeError
+                if not hmac.compare_digest(signature.encode(), computed_signature.encode()):
                     return Response({'error': 'Invalid signature'}, status=400)
 
             data = request.data
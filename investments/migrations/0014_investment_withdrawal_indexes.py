@@ -0,0 +1,23 @@
+# Generated by Django 5.2.2 on 2026-10-15 14:36
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('investments', '0013_user_created_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='investment',
+            index=models.Index(fields=['user', 'status', 'withdrawal_request'], name='inv_user_status_wr'),
+        ),
+        migrations.AddIndex(
+            model_name='withdrawalrequest',
+            index=models.Index(fields=['status'], name='withdrawal_status'),
+        ),
+    ]
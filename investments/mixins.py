@@ -0,0 +1,74 @@
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+
+
+# Serializer class -> (select_related paths, prefetch_related paths)
+_RELATED_CACHE = {}
+
+
+def _walk_relations(serializer, model, prefix, many, select, prefetch):
+    """Collect relation paths read by ``serializer`` fields, starting at ``model``"""
+    for field in serializer.fields.values():
+        if field.write_only or isinstance(field, serializers.SerializerMethodField):
+            continue
+
+        nested = field.child if isinstance(field, serializers.ListSerializer) else field
+        if field.source == '*':
+            if isinstance(nested, serializers.BaseSerializer):
+                _walk_relations(nested, model, prefix, many, select, prefetch)
+            continue
+
+        current_model, path, path_many = model, list(prefix), many
+        for attr in field.source.split('.'):
+            try:
+                model_field = current_model._meta.get_field(attr)
+            except FieldDoesNotExist:
+                break
+            if not model_field.is_relation:
+                break
+
+            path.append(attr)
+            hop_many = model_field.many_to_many or model_field.one_to_many
+            path_many = path_many or hop_many
+            current_model = model_field.related_model
+        else:
+            # A bare foreign key only needs the local *_id column
+            if isinstance(field, serializers.PrimaryKeyRelatedField) and not hop_many \
+                    and len(path) == len(prefix) + 1:
+                continue
+
+            (prefetch if path_many else select).add('__'.join(path))
+            if isinstance(nested, serializers.BaseSerializer):
+                _walk_relations(nested, current_model, path, path_many, select, prefetch)
+            continue
+
+        # The chain ended on a plain column (e.g. package.name); join everything before it
+        if len(path) > len(prefix):
+            (prefetch if path_many else select).add('__'.join(path))
+
+
+def get_related_paths(serializer_class, model):
+    """Return the select_related and prefetch_related paths a serializer needs"""
+    key = (serializer_class, model)
+    if key not in _RELATED_CACHE:
+        select, prefetch = set(), set()
+        _walk_relations(serializer_class(), model, [], False, select, prefetch)
+        _RELATED_CACHE[key] = (sorted(select), sorted(prefetch))
+    return _RELATED_CACHE[key]
+
+
+class AutoPrefetchMixin:
+    """Join or prefetch every relation the current serializer reads through ``source``
+
+    Relations reached only from SerializerMethodField bodies cannot be seen here and
+    still need an explicit select_related in the viewset.
+    """
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        select, prefetch = get_related_paths(self.get_serializer_class(), queryset.model)
+        if select:
+            queryset = queryset.select_related(*select)
+        if prefetch:
+            queryset = queryset.prefetch_related(*prefetch)
+        return queryset
@@ -136,6 +136,9 @@ class Investment(models.Model):
     
     class Meta:
         ordering = ['-investment_date']
+        indexes = [
+            models.Index(fields=['user', 'status', 'withdrawal_request'], name='inv_user_status_wr'),
+        ]
     
     def __str__(self):
         return f"{self.user.email} - {self.package.name} - {self.amount}"
@@ -247,6 +250,9 @@ class Transaction(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='txn_user_created_desc'),
+        ]
     
     def __str__(self):
         return f"{self.user.email} - {self.transaction_type} - {self.amount}"
@@ -358,6 +364,9 @@ class Payment(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='payment_user_created_desc'),
+        ]
     
     def __str__(self):
         return f"{self.user.email} - {self.amount} {self.currency} - {self.status}"
@@ -400,6 +409,9 @@ class WithdrawalRequest(models.Model):
     
     class Meta:
         ordering = ['-request_date']
+        indexes = [
+            models.Index(fields=['status'], name='withdrawal_status'),
+        ]
     
     def __str__(self):
         return f"{self.user.email} - {self.amount} - {self.status}"
@@ -1,3 +1,25 @@
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Investment, InvestmentPackage
+
+PACKAGE_STATS_CACHE_KEY = 'investments:package_stats'
+PACKAGE_CATEGORIES_CACHE_KEY = 'investments:package_categories'
+
+
+@receiver([post_save, post_delete], sender=InvestmentPackage)
+def invalidate_package_cache(sender, **kwargs):
+    """Drop cached package categories and stats when a package changes"""
+    cache.delete_many([PACKAGE_STATS_CACHE_KEY, PACKAGE_CATEGORIES_CACHE_KEY])
+
+
+@receiver([post_save, post_delete], sender=Investment)
+def invalidate_package_stats_cache(sender, **kwargs):
+    """Drop cached package stats when an investment changes"""
+    cache.delete(PACKAGE_STATS_CACHE_KEY)
+
+
 # # your_app/signals.py
 # from django.db.models.signals import post_save
 # from django.dispatch import receiver
@@ -1,3 +1,163 @@
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from .mixins import get_related_paths
+from .models import Investment, InvestmentPackage, Payment, Transaction
+from .serializers import InvestmentSerializer, PaymentSerializer, TransactionSerializer
+
+
+class InvestmentTestCase(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.admin = User.objects.create_superuser(email='admin@example.com', password='pass')
+        self.user = User.objects.create_user(email='investor@example.com', password='pass', is_kyc_complete=True)
+        self.package = InvestmentPackage.objects.create(
+            name='Grain Fund', description='d', category='grains', risk_level='low',
+            min_amount=10, max_amount=1000, interest_rate=Decimal('10'), duration_months=1,
+            total_slots=10, available_slots=10,
+            start_date=date.today(), end_date=date.today() + timedelta(days=30),
+        )
+        self.investments = [
+            Investment.objects.create(
+                user=self.user, package=self.package, amount=Decimal(100 + index), status=status,
+                start_date=date.today() - timedelta(days=40), end_date=date.today() - timedelta(days=1),
+                actual_return=Decimal(120 + index) if status == 'completed' else None,
+            )
+            for index, status in enumerate(['pending', 'active', 'completed', 'completed', 'completed'])
+        ]
+        Transaction.objects.create(
+            user=self.user, investment=self.investments[1], transaction_type='investment', amount=5
+        )
+        Transaction.objects.create(user=self.user, transaction_type='referral_bonus', amount=7)
+        Transaction.objects.create(user=self.user, transaction_type='referral_bonus', amount=8)
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.admin_client = APIClient()
+        self.admin_client.force_authenticate(self.admin)
+
+
+class InvestmentListPaginationTests(InvestmentTestCase):
+    def test_unpaginated_without_page_size(self):
+        response = self.client.get('/api/investments/investments/completed/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIsInstance(response.data, list)
+        self.assertEqual(len(response.data), 3)
+
+    def test_page_size_walks_the_cursor_newest_first(self):
+        completed_ids = [investment.id for investment in reversed(self.investments[2:])]
+
+        first = self.client.get('/api/investments/investments/completed/?page_size=2')
+        self.assertEqual([row['id'] for row in first.data['results']], completed_ids[:2])
+        self.assertIsNone(first.data['previous'])
+
+        second = self.client.get(first.data['next'])
+        self.assertEqual([row['id'] for row in second.data['results']], completed_ids[2:])
+        self.assertIsNone(second.data['next'])
+
+    def test_withdrawable_and_by_type_paginate(self):
+        withdrawable = self.client.get('/api/investments/investments/withdrawable/?page_size=1')
+        by_type = self.client.get('/api/investments/transactions/by_type/?type=referral_bonus&page_size=1')
+
+        self.assertEqual(len(withdrawable.data['results']), 1)
+        self.assertIsNotNone(withdrawable.data['next'])
+        self.assertEqual(by_type.data['results'][0]['amount'], '8.00')
+        self.assertIsNotNone(by_type.data['next'])
+
+    def test_projected_list_still_serializes_joined_fields(self):
+        response = self.client.get('/api/investments/investments/active/')
+
+        row = response.data[0]
+        self.assertEqual(row['id'], self.investments[1].id)
+        self.assertEqual(row['package_name'], 'Grain Fund')
+        self.assertEqual(row['user_email'], 'investor@example.com')
+        self.assertEqual(row['amount'], '101.00')
+
+    def test_list_selects_only_serialized_columns(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/api/investments/investments/')
+
+        investment_sql = queries.captured_queries[-1]['sql']
+        self.assertIn('"investments_investmentpackage"."name"', investment_sql)
+        self.assertNotIn('"investments_investmentpackage"."description"', investment_sql)
+        self.assertNotIn('"users_user"."password"', investment_sql)
+
+
+class AutoPrefetchTests(InvestmentTestCase):
+    def test_related_paths_follow_serializer_sources(self):
+        self.assertEqual(get_related_paths(InvestmentSerializer, Investment), (['package', 'user'], []))
+        self.assertEqual(get_related_paths(TransactionSerializer, Transaction), (['investment__package'], []))
+        self.assertEqual(
+            get_related_paths(PaymentSerializer, Payment), (['investment__package', 'user'], [])
+        )
+
+    def assertQueriesIndependentOfRows(self, client, url, add_row):
+        with CaptureQueriesContext(connection) as before:
+            self.assertEqual(client.get(url).status_code, 200)
+        for _ in range(3):
+            add_row()
+        with CaptureQueriesContext(connection) as after:
+            client.get(url)
+        self.assertEqual(len(after), len(before), url)
+
+    def add_investment(self):
+        investment = Investment.objects.create(
+            user=self.user, package=self.package, amount=Decimal('50'),
+            start_date=date.today(), end_date=date.today() + timedelta(days=30),
+        )
+        Transaction.objects.create(
+            user=self.user, investment=investment, transaction_type='investment', amount=50
+        )
+        Payment.objects.create(
+            user=self.user, investment=investment, amount=50, paystack_reference=f'ref-{investment.pk}'
+        )
+
+    def test_list_queries_do_not_grow_with_rows(self):
+        for client, url in (
+            (self.client, '/api/investments/investments/'),
+            (self.client, '/api/investments/transactions/'),
+            (self.client, '/api/investments/payments/'),
+            (self.admin_client, '/api/investments/admin/investments/'),
+        ):
+            self.assertQueriesIndependentOfRows(client, url, self.add_investment)
+
+
+class SoldOutPaymentTests(InvestmentTestCase):
+    def setUp(self):
+        super().setUp()
+        self.pending = self.investments[0]
+        self.payment = Payment.objects.create(
+            user=self.user, investment=self.pending, amount=Decimal('100'), paystack_reference='ref-sold-out'
+        )
+        InvestmentPackage.objects.filter(pk=self.package.pk).update(available_slots=0)
+
+    def verify(self):
+        with mock.patch('investments.views.PAYSTACK') as paystack:
+            paystack.get.return_value.json.return_value = {
+                'status': True, 'data': {'status': 'success', 'reference': 'ref-sold-out'}
+            }
+            return self.client.post('/api/investments/payments/verify/', {'reference': 'ref-sold-out'})
+
+    def test_refund_flagged_payment_stays_unsettled_after_a_slot_frees(self):
+        self.assertEqual(self.verify().data['status'], 'failed')
+
+        InvestmentPackage.objects.filter(pk=self.package.pk).update(available_slots=1)
+        response = self.verify()
 
-# Create your tests here.
+        self.assertEqual(response.data['status'], 'failed')
+        self.payment.refresh_from_db()
+        self.pending.refresh_from_db()
+        self.package.refresh_from_db()
+        self.assertEqual(self.payment.status, 'failed')
+        self.assertEqual(self.payment.metadata['refund_required'], 'package_sold_out')
+        self.assertEqual(self.pending.status, 'pending')
+        self.assertEqual(self.package.available_slots, 1)
+        self.assertFalse(Transaction.objects.filter(payment_reference='ref-sold-out').exists())
@@ -2,19 +2,31 @@ from asyncio.log import logger
 from django.shortcuts import render
 from rest_framework import viewsets, status, permissions, serializers
 from rest_framework.decorators import action
+from rest_framework.pagination import CursorPagination
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
-from django.db.models import Sum, Count
+from django.db.models import Sum, Count, Exists, F, OuterRef, Subquery, TextField, Value
+from django.db.models.functions import Concat, TruncMonth
+from django.core.cache import cache
+from django.utils.decorators import method_decorator
+from django.views.decorators.cache import cache_control, cache_page
+from django.views.decorators.vary import vary_on_headers
 from django.utils import timezone
-from datetime import date, timedelta
+from datetime import date, datetime, timedelta
 from django.contrib.auth import get_user_model
 from django.conf import settings
+from django.db import transaction as db_transaction
+import hashlib
+import hmac
 import time
 import requests
+from requests.adapters import HTTPAdapter
 from rest_framework.decorators import api_view, permission_classes
 from django.db.models import Q
 
 from .models import InvestmentPackage, Investment, Transaction, Portfolio, Payment, WithdrawalRequest
+from .mixins import AutoPrefetchMixin
+from .signals import PACKAGE_CATEGORIES_CACHE_KEY, PACKAGE_STATS_CACHE_KEY
 from .serializers import (
     InvestmentPackageSerializer,
     InvestmentPackageDetailSerializer,
@@ -29,6 +41,68 @@ from .serializers import (
     WithdrawalRequestSerializer
 )
 
+# Upper bound on how long a worker waits on api.paystack.co (seconds)
+PAYSTACK_TIMEOUT = 10
+
+# Webhook signing key, encoded once rather than on every request
+PAYSTACK_SECRET = getattr(settings, 'PAYSTACK_SECRET_KEY', '').encode('utf-8')
+
+# Keyed HMAC state; copy() per webhook skips re-deriving the key pads. Never update() it directly
+PAYSTACK_HMAC = hmac.new(PAYSTACK_SECRET, digestmod=hashlib.sha512)
+
+# References whose charge.success has been applied, to drop Paystack retries early
+PAYSTACK_SEEN_CACHE_KEY = 'paystack:seen:{}'
+PAYSTACK_SEEN_TIMEOUT = 60 * 60
+
+# Shared keep-alive session so verification calls reuse pooled TCP/TLS connections
+PAYSTACK = requests.Session()
+PAYSTACK.mount('https://', HTTPAdapter(pool_connections=10, pool_maxsize=20))
+PAYSTACK.headers.update({
+    'Authorization': f"Bearer {getattr(settings, 'PAYSTACK_SECRET_KEY', '')}",
+    'Content-Type': 'application/json',
+})
+
+# Columns InvestmentSerializer reads, including the joined package and user
+INVESTMENT_LIST_FIELDS = (
+    'id', 'package', 'amount', 'status', 'expected_return', 'actual_return',
+    'investment_date', 'start_date', 'end_date', 'completed_date',
+    'progress_percentage', 'referred_by', 'withdrawal_request',
+    'package__name', 'package__image',
+    'user__email', 'user__first_name', 'user__last_name',
+)
+
+
+class OptionalCursorPagination(CursorPagination):
+    """Cursor pagination that only applies when the client sends ?page_size="""
+    
+    ordering = '-id'
+    page_size = None
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class PaginatedListMixin:
+    """Serialize a queryset through the viewset's paginator when one applies"""
+    
+    def paginated_response(self, queryset):
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        serializer = self.get_serializer(queryset, many=True)
+        return Response(serializer.data)
+
+
+# Public package reads are shared by every client; vary_on_headers sits inside
+# cache_page so the Vary header is part of the cache key
+PACKAGE_PAGE_CACHE = [cache_control(public=True), cache_page(60), vary_on_headers('Accept', 'Authorization')]
+PACKAGE_HTTP_CACHE = [cache_control(public=True, max_age=60), vary_on_headers('Accept', 'Authorization')]
+
+
+@method_decorator(PACKAGE_PAGE_CACHE, name='list')
+@method_decorator(PACKAGE_PAGE_CACHE, name='retrieve')
+@method_decorator(PACKAGE_HTTP_CACHE, name='categories')
+@method_decorator(PACKAGE_HTTP_CACHE, name='stats')
 class InvestmentPackageViewSet(viewsets.ReadOnlyModelViewSet):
     """ViewSet for investment packages"""
     
@@ -41,55 +115,55 @@ class InvestmentPackageViewSet(viewsets.ReadOnlyModelViewSet):
         return InvestmentPackageSerializer
     
     def get_queryset(self):
-        queryset = super().get_queryset()
-        
-        # Filter by category
-        category = self.request.query_params.get('category', None)
-        if category:
-            queryset = queryset.filter(category=category)
-        
-        # Filter by risk level
-        risk_level = self.request.query_params.get('risk_level', None)
-        if risk_level:
-            queryset = queryset.filter(risk_level=risk_level)
-        
-        # Filter by minimum amount
-        min_amount = self.request.query_params.get('min_amount', None)
-        if min_amount:
-            queryset = queryset.filter(min_amount__gte=min_amount)
-        
-        # Filter by maximum amount
-        max_amount = self.request.query_params.get('max_amount', None)
-        if max_amount:
-            queryset = queryset.filter(max_amount__lte=max_amount)
-        
-        return queryset
+        params = self.request.query_params
+        
+        # Build every filter in one pass so the queryset is cloned once
+        filters = {
+            lookup: value
+            for lookup, value in (
+                ('category', params.get('category')),
+                ('risk_level', params.get('risk_level')),
+                ('min_amount__gte', params.get('min_amount')),
+                ('max_amount__lte', params.get('max_amount')),
+            )
+            if value
+        }
+        return super().get_queryset().filter(**filters)
     
     @action(detail=False, methods=['get'])
     def categories(self, request):
         """Get all available categories"""
-        categories = InvestmentPackage.objects.values_list('category', flat=True).distinct()
-        return Response(list(categories))
+        categories = cache.get_or_set(
+            PACKAGE_CATEGORIES_CACHE_KEY,
+            lambda: list(InvestmentPackage.objects.values_list('category', flat=True).distinct()),
+            300
+        )
+        return Response(categories)
     
     @action(detail=False, methods=['get'])
     def stats(self, request):
         """Get investment package statistics"""
+        return Response(cache.get_or_set(PACKAGE_STATS_CACHE_KEY, self._package_stats, 60))
+    
+    def _package_stats(self):
         total_packages = InvestmentPackage.objects.filter(status='active').count()
-        total_investments = Investment.objects.count()
-        total_amount_invested = Investment.objects.aggregate(
-            total=Sum('amount')
-        )['total'] or 0
+        investment_totals = Investment.objects.aggregate(
+            total_investments=Count('id'),
+            total_amount_invested=Sum('amount'),
+        )
         
-        return Response({
+        return {
             'total_packages': total_packages,
-            'total_investments': total_investments,
-            'total_amount_invested': total_amount_invested,
-        })
+            'total_investments': investment_totals['total_investments'],
+            'total_amount_invested': investment_totals['total_amount_invested'] or 0,
+        }
 
-class InvestmentViewSet(viewsets.ModelViewSet):
+class InvestmentViewSet(AutoPrefetchMixin, PaginatedListMixin, viewsets.ModelViewSet):
     """ViewSet for user investments"""
     
     permission_classes = [IsAuthenticated]
+    queryset = Investment.objects.all()
+    pagination_class = OptionalCursorPagination
     
     def get_serializer_class(self):
         if self.action == 'create':
@@ -97,7 +171,13 @@ class InvestmentViewSet(viewsets.ModelViewSet):
         return InvestmentSerializer
     
     def get_queryset(self):
-        return Investment.objects.filter(user=self.request.user)
+        # withdrawal_request is read in a SerializerMethodField, out of the mixin's sight
+        queryset = super().get_queryset().filter(user=self.request.user).select_related(
+            'withdrawal_request'
+        )
+        if self.action in ('list', 'active', 'completed', 'withdrawable'):
+            queryset = queryset.only(*INVESTMENT_LIST_FIELDS)
+        return queryset
     
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
@@ -121,37 +201,36 @@ class InvestmentViewSet(viewsets.ModelViewSet):
     def active(self, request):
         """Get user's active investments"""
         active_investments = self.get_queryset().filter(status='active')
-        serializer = self.get_serializer(active_investments, many=True)
-        return Response(serializer.data)
+        return self.paginated_response(active_investments)
     
     @action(detail=False, methods=['get'])
     def completed(self, request):
         """Get user's completed investments"""
         completed_investments = self.get_queryset().filter(status='completed')
-        serializer = self.get_serializer(completed_investments, many=True)
-        return Response(serializer.data)
+        return self.paginated_response(completed_investments)
     
     @action(detail=False, methods=['get'])
     def summary(self, request):
         """Get user's investment summary"""
-        investments = self.get_queryset()
-        
-        total_invested = investments.aggregate(total=Sum('amount'))['total'] or 0
-        total_returns = investments.filter(status='completed').aggregate(
-            total=Sum('actual_return')
-        )['total'] or 0
-        active_investments = investments.filter(status='active').count()
-        completed_investments = investments.filter(status='completed').count()
+        totals = Investment.objects.filter(user=request.user).aggregate(
+            total_invested=Sum('amount'),
+            total_returns=Sum('actual_return', filter=Q(status='completed')),
+            active_investments=Count('id', filter=Q(status='active')),
+            completed_investments=Count('id', filter=Q(status='completed')),
+        )
+        total_invested = totals['total_invested'] or 0
+        total_returns = totals['total_returns'] or 0
         
         return Response({
             'total_invested': total_invested,
             'total_returns': total_returns,
-            'active_investments': active_investments,
-            'completed_investments': completed_investments,
+            'active_investments': totals['active_investments'],
+            'completed_investments': totals['completed_investments'],
             'total_portfolio_value': total_invested + total_returns,
         })
     
     @action(detail=True, methods=['post'])
+    @db_transaction.atomic
     def complete(self, request, pk=None):
         """Mark investment as completed (frontend-triggered)"""
         investment = self.get_object()
@@ -169,18 +248,15 @@ class InvestmentViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Update status
+        # Update status, writing only the two changed columns
         investment.status = 'completed'
         investment.completed_date = timezone.now()
-        investment.save()
+        Investment.objects.filter(pk=investment.pk).update(
+            status=investment.status, completed_date=investment.completed_date
+        )
         
         # Clean up any cancelled payments (one-time operation)
         self.cleanup_cancelled_payments(investment)
-
-        Payment.objects.filter(
-            investment=investment,
-            status='cancelled'
-        ).delete()
         
         return Response({
             'success': True,
@@ -195,19 +271,6 @@ class InvestmentViewSet(viewsets.ModelViewSet):
             status='cancelled'
         ).delete()
 
-    def list(self, request, *args, **kwargs):
-        """List investments with one-time cleanup of cancelled investments"""
-        if request.user.is_authenticated:
-            # Delete cancelled investments that belong to this user
-            deleted_count, _ = Investment.objects.filter(
-                Q(user=request.user) & 
-                Q(status='cancelled')
-            ).delete()
-            
-            print(f"Deleted {deleted_count} cancelled investments for user {request.user.id}")
-
-        return super().list(request, *args, **kwargs)
-
     @action(detail=False, methods=['get'])
     def withdrawable(self, request):
         """Get user's completed investments that haven't been withdrawn"""
@@ -215,10 +278,10 @@ class InvestmentViewSet(viewsets.ModelViewSet):
             status='completed',
             withdrawal_request__isnull=True
         )
-        serializer = self.get_serializer(completed_investments, many=True)
-        return Response(serializer.data)
+        return self.paginated_response(completed_investments)
     
     @action(detail=True, methods=['post'])
+    @db_transaction.atomic
     def cancel(self, request, pk=None):
         """Cancel an investment"""
         investment = self.get_object()
@@ -229,8 +292,7 @@ class InvestmentViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        investment.status = 'cancelled'
-        investment.save()
+        Investment.objects.filter(pk=investment.pk).update(status='cancelled')
         
         # Refund the amount
         Transaction.objects.create(
@@ -243,23 +305,25 @@ class InvestmentViewSet(viewsets.ModelViewSet):
         )
         
         # Update package available slots
-        package = investment.package
-        package.available_slots += 1
-        package.save()
+        InvestmentPackage.objects.filter(pk=investment.package_id).update(
+            available_slots=F('available_slots') + 1
+        )
         
         # Delete the investment after refund and slot update
         investment.delete()
         
         return Response({'message': 'Investment cancelled and deleted successfully'})
 
-class TransactionViewSet(viewsets.ReadOnlyModelViewSet):
+class TransactionViewSet(AutoPrefetchMixin, PaginatedListMixin, viewsets.ReadOnlyModelViewSet):
     """ViewSet for user transactions"""
     
     permission_classes = [IsAuthenticated]
     serializer_class = TransactionSerializer
+    queryset = Transaction.objects.all()
+    pagination_class = OptionalCursorPagination
     
     def get_queryset(self):
-        return Transaction.objects.filter(user=self.request.user)
+        return super().get_queryset().filter(user=self.request.user)
     
     @action(detail=False, methods=['get'])
     def recent(self, request):
@@ -277,8 +341,7 @@ class TransactionViewSet(viewsets.ReadOnlyModelViewSet):
         else:
             transactions = self.get_queryset()
         
-        serializer = self.get_serializer(transactions, many=True)
-        return Response(serializer.data)
+        return self.paginated_response(transactions)
 
 class PortfolioViewSet(viewsets.ReadOnlyModelViewSet):
     """ViewSet for user portfolio"""
@@ -299,25 +362,24 @@ class PortfolioViewSet(viewsets.ReadOnlyModelViewSet):
     @action(detail=False, methods=['get'])
     def performance(self, request):
         """Get portfolio performance over time"""
-        # Get investments grouped by month
-        investments = Investment.objects.filter(user=request.user)
+        # First day of each of the last 6 months, newest first
+        months = [timezone.localdate().replace(day=1)]
+        for _ in range(5):
+            months.append((months[-1] - timedelta(days=1)).replace(day=1))
+        
+        # Get investments grouped by month in a single query
+        totals = Investment.objects.filter(
+            user=request.user,
+            investment_date__gte=timezone.make_aware(datetime.combine(months[-1], datetime.min.time()))
+        ).annotate(month=TruncMonth('investment_date')).values('month').annotate(total=Sum('amount')).order_by()
+        invested_by_month = {row['month'].date(): row['total'] for row in totals}
         
         # Calculate monthly performance (simplified)
         performance_data = []
-        for i in range(6):  # Last 6 months
-            month_date = timezone.now().date() - timedelta(days=30*i)
-            month_investments = investments.filter(
-                investment_date__month=month_date.month,
-                investment_date__year=month_date.year
-            )
-            
-            total_invested = month_investments.aggregate(
-                total=Sum('amount')
-            )['total'] or 0
-            
+        for month_date in months:
             performance_data.append({
                 'month': month_date.strftime('%B %Y'),
-                'invested': total_invested,
+                'invested': invested_by_month.get(month_date) or 0,
                 'returns': 0,  # Simplified - would need actual return data
             })
         
@@ -326,17 +388,12 @@ class PortfolioViewSet(viewsets.ReadOnlyModelViewSet):
     @action(detail=False, methods=['get'])
     def allocation(self, request):
         """Get investment allocation by category"""
-        investments = Investment.objects.filter(
+        totals = Investment.objects.filter(
             user=request.user,
             status='active'
-        ).select_related('package')
+        ).values('package__category').annotate(total=Sum('amount')).order_by()
         
-        allocation = {}
-        for investment in investments:
-            category = investment.package.category
-            if category not in allocation:
-                allocation[category] = 0
-            allocation[category] += float(investment.amount)
+        allocation = {row['package__category']: float(row['total']) for row in totals}
         
         return Response(allocation)
 
@@ -351,21 +408,19 @@ class DashboardStatsView(APIView):
     def get(self, request):
         user = request.user
         
-        # Get user's investments
-        investments = Investment.objects.filter(user=user)
-        active_investments = investments.filter(status='active')
-        completed_investments = investments.filter(status='completed')
-        
-        # Calculate totals
-        total_invested = investments.aggregate(total=Sum('amount'))['total'] or 0
-        total_returns = completed_investments.aggregate(
-            total=Sum('actual_return')
-        )['total'] or 0
+        # Calculate investment totals in one pass
+        investment_totals = Investment.objects.filter(user=user).aggregate(
+            total_invested=Sum('amount'),
+            total_returns=Sum('actual_return', filter=Q(status='completed')),
+            active_investments=Count('id', filter=Q(status='active')),
+        )
+        total_invested = investment_totals['total_invested'] or 0
+        total_returns = investment_totals['total_returns'] or 0
         
         # Get recent transactions
         recent_transactions = Transaction.objects.filter(
             user=user
-        ).order_by('-created_at')[:5]
+        ).select_related('investment__package').order_by('-created_at')[:5]
         
         # Get referral earnings
         referral_earnings = Transaction.objects.filter(
@@ -376,7 +431,7 @@ class DashboardStatsView(APIView):
         
         return Response({
             'total_portfolio': total_invested + total_returns,
-            'active_investments': active_investments.count(),
+            'active_investments': investment_totals['active_investments'],
             'monthly_returns': total_returns,  # Simplified
             'referral_earnings': referral_earnings,
             'recent_transactions': TransactionSerializer(
@@ -396,17 +451,15 @@ class AdminUserViewSet(viewsets.ReadOnlyModelViewSet):
     @action(detail=False, methods=['get'])
     def stats(self, request):
         """Get user statistics"""
-        total_users = get_user_model().objects.count()
-        active_users = get_user_model().objects.filter(is_active=True).count()
-        verified_users = get_user_model().objects.filter(is_verified=True).count()
+        user_stats = get_user_model().objects.aggregate(
+            total_users=Count('id'),
+            active_users=Count('id', filter=Q(is_active=True)),
+            verified_users=Count('id', filter=Q(is_verified=True)),
+        )
         
-        return Response({
-            'total_users': total_users,
-            'active_users': active_users,
-            'verified_users': verified_users,
-        })
+        return Response(user_stats)
 
-class AdminInvestmentViewSet(viewsets.ModelViewSet):
+class AdminInvestmentViewSet(AutoPrefetchMixin, viewsets.ModelViewSet):
     """Admin ViewSet for managing all investments"""
     
     permission_classes = [IsAdminUser]
@@ -419,6 +472,7 @@ class AdminInvestmentViewSet(viewsets.ModelViewSet):
         return InvestmentSerializer
     
     @action(detail=True, methods=['post'])
+    @db_transaction.atomic
     def approve(self, request, pk=None):
         """Approve an investment - only if payment is completed"""
         investment = self.get_object()
@@ -430,21 +484,12 @@ class AdminInvestmentViewSet(viewsets.ModelViewSet):
             )
         
         # Check if there's a successful payment for this investment
-        try:
-            payment = Payment.objects.get(investment=investment, status='success')
-        except Payment.DoesNotExist:
+        if not Payment.objects.filter(investment=investment, status='success').exists():
             return Response(
                 {'error': 'Investment cannot be approved without successful payment'},
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Check if payment is actually successful
-        if payment.status != 'success':
-            return Response(
-                {'error': 'Payment must be completed before investment can be approved'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
         investment.status = 'active'
         investment.save()
         
@@ -471,76 +516,81 @@ class AdminInvestmentViewSet(viewsets.ModelViewSet):
         """Get payment status for an investment"""
         investment = self.get_object()
         
-        try:
-            payment = Payment.objects.get(investment=investment)
-            return Response({
-                'payment_status': payment.status,
-                'payment_amount': payment.amount,
-                'payment_date': payment.created_at,
-                'can_approve': payment.status == 'success'
-            })
-        except Payment.DoesNotExist:
+        payment = Payment.objects.filter(investment=investment).only(
+            'status', 'amount', 'created_at'
+        ).order_by('-created_at').first()
+        if payment is None:
             return Response({
                 'payment_status': 'no_payment',
                 'can_approve': False
             })
+        
+        return Response({
+            'payment_status': payment.status,
+            'payment_amount': payment.amount,
+            'payment_date': payment.created_at,
+            'can_approve': payment.status == 'success'
+        })
     
     @action(detail=False, methods=['get'])
     def stats(self, request):
         """Get investment statistics"""
-        total_investments = Investment.objects.count()
-        pending_investments = Investment.objects.filter(status='pending').count()
-        active_investments = Investment.objects.filter(status='active').count()
-        completed_investments = Investment.objects.filter(status='completed').count()
-        total_amount = Investment.objects.aggregate(total=Sum('amount'))['total'] or 0
+        totals = Investment.objects.aggregate(
+            total_investments=Count('id'),
+            pending_investments=Count('id', filter=Q(status='pending')),
+            active_investments=Count('id', filter=Q(status='active')),
+            completed_investments=Count('id', filter=Q(status='completed')),
+            total_amount=Sum('amount'),
+        )
         
         # Count pending investments with successful payments
-        pending_with_payment = 0
-        for investment in Investment.objects.filter(status='pending'):
-            try:
-                payment = Payment.objects.get(investment=investment, status='success')
-                pending_with_payment += 1
-            except Payment.DoesNotExist:
-                pass
+        pending_with_payment = Investment.objects.filter(status='pending').filter(
+            Exists(Payment.objects.filter(investment=OuterRef('pk'), status='success'))
+        ).count()
         
         return Response({
-            'total_investments': total_investments,
-            'pending_investments': pending_investments,
+            'total_investments': totals['total_investments'],
+            'pending_investments': totals['pending_investments'],
             'pending_with_payment': pending_with_payment,
-            'active_investments': active_investments,
-            'completed_investments': completed_investments,
-            'total_amount': total_amount,
+            'active_investments': totals['active_investments'],
+            'completed_investments': totals['completed_investments'],
+            'total_amount': totals['total_amount'] or 0,
         })
     
     @action(detail=True, methods=['post'])
     def force_approve(self, request, pk=None):
         """Admin-only action to force approve an investment"""
         try:
-            investment = Investment.objects.get(pk=pk)
-            
-            # Update investment status
-            investment.status = 'active'
-            investment.start_date = timezone.now().date()
-            investment.end_date = investment.package.end_date
-            investment.save()
+            investment = Investment.objects.select_related('package', 'user').get(pk=pk)
             
-            # Create a payment record
-            Payment.objects.create(
-                user=investment.user,
-                investment=investment,
-                amount=investment.amount,
-                status='success',
-                payment_method='admin_override',
-                paystack_reference=f'ADMIN-APPROVAL-{timezone.now().timestamp()}',
-                # These fields are required in your model
-                currency='NGN',
-                paystack_access_code='ADMIN-OVERRIDE',
-                paystack_authorization_url='',  # Empty since this is admin override
-                metadata={
-                    'admin_override': True,
-                    'admin_user': request.user.id
-                }
-            )
+            # Status change and override payment commit together or not at all
+            with db_transaction.atomic():
+                investment.status = 'active'
+                investment.start_date = timezone.now().date()
+                investment.end_date = investment.package.end_date
+                Investment.objects.filter(pk=investment.pk).update(
+                    status=investment.status,
+                    start_date=investment.start_date,
+                    end_date=investment.end_date
+                )
+                
+                # Create a payment record
+                Payment.objects.create(
+                    user=investment.user,
+                    investment=investment,
+                    amount=investment.amount,
+                    status='success',
+                    payment_method='admin_override',
+                    paystack_reference=f'ADMIN-APPROVAL-{timezone.now().timestamp()}',
+                    # These fields are required in your model
+                    currency='NGN',
+                    paystack_access_code='ADMIN-OVERRIDE',
+                    paystack_authorization_url='',  # Empty since this is admin override
+                    metadata={
+                        'admin_override': True,
+                        'admin_user': request.user.id
+                    }
+                )
             
             return Response({
                 'success': True,
@@ -586,7 +636,7 @@ class AdminInvestmentViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         queryset = super().get_queryset()
         # Add any filtering logic here
-        return queryset.select_related('withdrawal_request', 'user', 'package')
+        return queryset.select_related('withdrawal_request')
 
 class AdminPackageViewSet(viewsets.ModelViewSet):
     """Admin ViewSet for managing investment packages"""
@@ -603,14 +653,18 @@ class AdminPackageViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def stats(self, request):
         """Get package statistics"""
-        total_packages = InvestmentPackage.objects.count()
-        active_packages = InvestmentPackage.objects.filter(status='active').count()
-        total_slots = InvestmentPackage.objects.aggregate(total=Sum('total_slots'))['total'] or 0
-        available_slots = InvestmentPackage.objects.aggregate(total=Sum('available_slots'))['total'] or 0
+        package_stats = InvestmentPackage.objects.aggregate(
+            total_packages=Count('id'),
+            active_packages=Count('id', filter=Q(status='active')),
+            total_slots=Sum('total_slots'),
+            available_slots=Sum('available_slots'),
+        )
+        total_slots = package_stats['total_slots'] or 0
+        available_slots = package_stats['available_slots'] or 0
         
         return Response({
-            'total_packages': total_packages,
-            'active_packages': active_packages,
+            'total_packages': package_stats['total_packages'],
+            'active_packages': package_stats['active_packages'],
             'total_slots': total_slots,
             'available_slots': available_slots,
             'filled_slots': total_slots - available_slots,
@@ -621,23 +675,23 @@ class AdminTransactionViewSet(viewsets.ReadOnlyModelViewSet):
     
     permission_classes = [IsAdminUser]
     serializer_class = TransactionSerializer
-    queryset = Transaction.objects.all()
+    queryset = Transaction.objects.select_related('investment__package')
     
     @action(detail=False, methods=['get'])
     def stats(self, request):
         """Get transaction statistics"""
-        total_transactions = Transaction.objects.count()
-        completed_transactions = Transaction.objects.filter(status='completed').count()
-        pending_transactions = Transaction.objects.filter(status='pending').count()
-        total_amount = Transaction.objects.filter(status='completed').aggregate(
-            total=Sum('amount')
-        )['total'] or 0
+        transaction_stats = Transaction.objects.aggregate(
+            total_transactions=Count('id'),
+            completed_transactions=Count('id', filter=Q(status='completed')),
+            pending_transactions=Count('id', filter=Q(status='pending')),
+            total_amount=Sum('amount', filter=Q(status='completed')),
+        )
         
         return Response({
-            'total_transactions': total_transactions,
-            'completed_transactions': completed_transactions,
-            'pending_transactions': pending_transactions,
-            'total_amount': total_amount,
+            'total_transactions': transaction_stats['total_transactions'],
+            'completed_transactions': transaction_stats['completed_transactions'],
+            'pending_transactions': transaction_stats['pending_transactions'],
+            'total_amount': transaction_stats['total_amount'] or 0,
         })
 
 class AdminDashboardView(APIView):
@@ -646,54 +700,130 @@ class AdminDashboardView(APIView):
     permission_classes = [IsAdminUser]
     
     def get(self, request):
-        # Get all statistics
-        users = get_user_model().objects
-        investments = Investment.objects
-        packages = InvestmentPackage.objects
-        transactions = Transaction.objects
-        
-        # User stats
-        total_users = users.count()
-        active_users = users.filter(is_active=True).count()
-        
-        # Investment stats
-        total_investments = investments.count()
-        total_invested = investments.aggregate(total=Sum('amount'))['total'] or 0
-        pending_investments = investments.filter(status='pending').count()
-        
-        # Package stats
-        total_packages = packages.count()
-        active_packages = packages.filter(status='active').count()
-        
-        # Transaction stats
-        total_transactions = transactions.count()
-        completed_transactions = transactions.filter(status='completed').count()
+        # Get all statistics, one aggregate per model
+        user_stats = get_user_model().objects.aggregate(
+            total_users=Count('id'),
+            active_users=Count('id', filter=Q(is_active=True)),
+        )
+        investment_stats = Investment.objects.aggregate(
+            total_investments=Count('id'),
+            total_invested=Sum('amount'),
+            pending_investments=Count('id', filter=Q(status='pending')),
+        )
+        package_stats = InvestmentPackage.objects.aggregate(
+            total_packages=Count('id'),
+            active_packages=Count('id', filter=Q(status='active')),
+        )
+        transaction_stats = Transaction.objects.aggregate(
+            total_transactions=Count('id'),
+            completed_transactions=Count('id', filter=Q(status='completed')),
+        )
         
         # Recent activity
-        recent_investments = investments.order_by('-investment_date')[:5]
-        recent_users = users.order_by('-date_joined')[:5]
+        recent_investments = Investment.objects.select_related(
+            'package', 'user', 'withdrawal_request'
+        ).order_by('-investment_date')[:5]
+        recent_users = get_user_model().objects.order_by('-date_joined')[:5]
 
         return Response({
             'overview': {
-                'total_users': total_users,
-                'active_users': active_users,
-                'total_investments': total_investments,
-                'total_invested': total_invested,
-                'pending_investments': pending_investments,
-                'total_packages': total_packages,
-                'active_packages': active_packages,
-                'total_transactions': total_transactions,
-                'completed_transactions': completed_transactions,
+                'total_users': user_stats['total_users'],
+                'active_users': user_stats['active_users'],
+                'total_investments': investment_stats['total_investments'],
+                'total_invested': investment_stats['total_invested'] or 0,
+                'pending_investments': investment_stats['pending_investments'],
+                'total_packages': package_stats['total_packages'],
+                'active_packages': package_stats['active_packages'],
+                'total_transactions': transaction_stats['total_transactions'],
+                'completed_transactions': transaction_stats['completed_transactions'],
             },
             'recent_investments': InvestmentSerializer(recent_investments, many=True).data,
             'recent_users': UserInvestmentSummarySerializer(recent_users, many=True).data,
         })
 
 
-class PaymentViewSet(viewsets.ModelViewSet):
+class PackageSoldOutError(Exception):
+    """A paid investment's package had no slot left; the success must be rolled back"""
+
+
+def flag_payment_for_refund(payment, reason):
+    """Mark a charged payment that could not be applied so an admin can refund it"""
+    payment.status = 'failed'
+    payment.metadata['refund_required'] = reason
+    payment.save(update_fields=['status', 'metadata', 'updated_at'])
+
+
+def investment_payment_transaction(payment, reference):
+    """Build (unsaved) the ledger row for a settled investment payment"""
+    return Transaction(
+        user=payment.user,
+        investment=payment.investment,
+        transaction_type='investment',
+        amount=payment.amount,
+        status='completed',
+        payment_method=payment.payment_method,
+        payment_reference=reference,
+        description=f'Payment for {payment.investment.package.name}'
+    )
+
+
+def record_investment_transactions(transactions):
+    """Insert ledger rows in batched INSERTs"""
+    return Transaction.objects.bulk_create(transactions, batch_size=500)
+
+
+def finalize_successful_payment(lookup, metadata_key, metadata_value):
+    """Apply a Paystack charge.success to the payment matching ``lookup``, at most once
+
+    Shared by PaymentViewSet.verify and PaystackWebhookView. Returns ``(payment, outcome)``
+    where outcome is 'applied', 'already_processed' or 'refund_required'.
+    """
+    try:
+        # Lock the payment so verify and the webhook cannot apply the same success twice
+        with db_transaction.atomic():
+            payment = Payment.objects.select_for_update(of=('self',)).select_related(
+                'investment__package', 'user'
+            ).get(**lookup)
+            
+            if payment.status == 'success':
+                return payment, 'already_processed'
+            
+            # A charge flagged for refund is terminal: a slot freed later must not settle it too
+            if payment.metadata.get('refund_required'):
+                return payment, 'refund_required'
+            
+            payment.status = 'success'
+            payment.paid_at = timezone.now()
+            payment.metadata[metadata_key] = metadata_value
+            payment.save(update_fields=['status', 'paid_at', 'metadata', 'updated_at'])
+            
+            # Update investment if linked
+            if payment.investment:
+                investment = payment.investment
+                investment.status = 'active'
+                investment.save()
+
+                # Reduce available slots ONLY after successful payment, never below zero
+                if not InvestmentPackage.objects.filter(
+                    pk=investment.package_id, available_slots__gt=0
+                ).update(available_slots=F('available_slots') - 1):
+                    raise PackageSoldOutError(investment.package_id)
+
+                record_investment_transactions([
+                    investment_payment_transaction(payment, payment.paystack_reference)
+                ])
+    except PackageSoldOutError:
+        flag_payment_for_refund(payment, 'package_sold_out')
+        return payment, 'refund_required'
+    
+    return payment, 'applied'
+
+
+class PaymentViewSet(AutoPrefetchMixin, viewsets.ModelViewSet):
     """ViewSet for payment transactions"""
     
     permission_classes = [IsAuthenticated]
+    queryset = Payment.objects.all()
     
     def get_serializer_class(self):
         if self.action == 'create':
@@ -701,7 +831,7 @@ class PaymentViewSet(viewsets.ModelViewSet):
         return PaymentSerializer
     
     def get_queryset(self):
-        return Payment.objects.filter(user=self.request.user)
+        return super().get_queryset().filter(user=self.request.user)
     
     def perform_create(self, serializer):
         payment = serializer.save(user=self.request.user)
@@ -712,17 +842,10 @@ class PaymentViewSet(viewsets.ModelViewSet):
             # TODO: Implement proper Paystack integration
             payment.paystack_reference = f"INV_{payment.id}_{int(time.time())}"
             payment.paystack_authorization_url = f"{settings.FRONTEND_URL}/payment/success"
-            
-            # Initialize metadata if it doesn't exist
-            if not hasattr(payment, 'metadata') or payment.metadata is None:
-                payment.metadata = {}
-            
             payment.save()
                 
         except Exception as e:
             payment.status = 'failed'
-            if not hasattr(payment, 'metadata') or payment.metadata is None:
-                payment.metadata = {}
             payment.metadata['error'] = str(e)
             payment.save()
             raise serializers.ValidationError(f"Payment initialization failed: {str(e)}")
@@ -746,15 +869,18 @@ class PaymentViewSet(viewsets.ModelViewSet):
             return Response({'error': 'Reference is required'}, status=400)
         
         try:
+            # PaymentSerializer reads user.email and investment.package.name, never metadata
+            payments = Payment.objects.select_related('investment__package', 'user').defer('metadata')
+            
             # First try to find payment by Paystack reference
             try:
-                payment = Payment.objects.get(
+                payment = payments.get(
                     paystack_reference=reference,
                     user=request.user
                 )
             except Payment.DoesNotExist:
                 # If not found by reference, try to find the most recent pending payment for this user
-                payment = Payment.objects.filter(
+                payment = payments.filter(
                     user=request.user,
                     status='pending'
                 ).order_by('-created_at').first()
@@ -764,56 +890,42 @@ class PaymentViewSet(viewsets.ModelViewSet):
                 
                 # Update the payment with the Paystack reference
                 payment.paystack_reference = reference
-                payment.save()
-            
+                payment.save(update_fields=['paystack_reference', 'updated_at'])
+
+            # The webhook usually finalizes the payment first; skip the Paystack round-trip then
+            if payment.status == 'success':
+                return Response({
+                    'status': 'success',
+                    'payment': PaymentSerializer(payment).data
+                })
+
             # Real Paystack verification
-            paystack_secret_key = getattr(settings, 'PAYSTACK_SECRET_KEY', '')
-            headers = {
-                'Authorization': f'Bearer {paystack_secret_key}',
-                'Content-Type': 'application/json',
-            }
             url = f'https://api.paystack.co/transaction/verify/{reference}'
-            resp = requests.get(url, headers=headers)
+            resp = PAYSTACK.get(url, timeout=PAYSTACK_TIMEOUT)
             response = resp.json()
             
             if response.get('status'):
                 transaction_data = response['data']
                 
                 if transaction_data['status'] == 'success':
-                    payment.status = 'success'
-                    payment.paid_at = timezone.now()
-                    payment.metadata['verification_data'] = transaction_data
-                    payment.save()
-                    
-                    # Update investment if linked
-                    if payment.investment:
-                        investment = payment.investment
-                        investment.status = 'active'
-                        investment.save()
-
-                        # Reduce available slots ONLY after successful payment
-                        package = investment.package
-                        package.available_slots -= 1
-                        package.save()
-
-                        Transaction.objects.create(
-                            user=payment.user,
-                            investment=investment,
-                            transaction_type='investment',
-                            amount=payment.amount,
-                            status='completed',
-                            payment_method=payment.payment_method,
-                            payment_reference=payment.paystack_reference,
-                            description=f'Payment for {investment.package.name}'
-                        )
+                    payment, outcome = finalize_successful_payment(
+                        {'pk': payment.pk}, 'verification_data', transaction_data
+                    )
+                    if outcome == 'refund_required':
+                        return Response({
+                            'status': 'failed',
+                            'message': 'This package is sold out; your payment has been flagged for refund'
+                        })
                     
                     return Response({
                         'status': 'success',
                         'payment': PaymentSerializer(payment).data
                     })
                 else:
-                    payment.status = 'failed'
-                    payment.save()
+                    # Never downgrade a payment the webhook has already settled
+                    Payment.objects.filter(pk=payment.pk).exclude(status='success').update(
+                        status='failed', updated_at=timezone.now()
+                    )
                     return Response({
                         'status': 'failed',
                         'message': transaction_data.get('gateway_response', 'Payment failed')
@@ -832,55 +944,39 @@ class PaymentViewSet(viewsets.ModelViewSet):
 class PaystackWebhookView(APIView):
     """Handle Paystack webhook notifications"""
     
+    # The HMAC signature is the only credential; skip JWT authentication entirely
+    authentication_classes = []
     permission_classes = [AllowAny]
     
     def post(self, request):
         try:
-            # Verify webhook signature
-            paystack_secret_key = getattr(settings, 'PAYSTACK_SECRET_KEY', '')
+            # Verify webhook signature against the raw body before any JSON parsing
             signature = request.headers.get('X-Paystack-Signature')
             
-            if not self.verify_signature(request.body, signature, paystack_secret_key):
+            if not self.verify_signature(request.body, signature):
                 return Response({'error': 'Invalid signature'}, status=400)
             
             # Process webhook data
-            event = request.data.get('event')
-            data = request.data.get('data', {})
+            payload = request.data
+            event = payload.get('event')
+            data = payload.get('data', {})
             
             if event == 'charge.success':
                 reference = data.get('reference')
-                payment = Payment.objects.get(paystack_reference=reference)
+                seen_key = PAYSTACK_SEEN_CACHE_KEY.format(reference)
                 
-                # Update payment status
-                payment.status = 'success'
-                payment.paid_at = timezone.now()
-                payment.metadata['paystack_data'] = data
-                payment.save()
+                # Retries of an event we already applied never reach the database
+                if cache.get(seen_key):
+                    return Response({'status': 'already_processed'})
                 
-                # Update investment status if linked
-                if payment.investment:
-                    investment = payment.investment
-                    investment.status = 'active'
-                    investment.save()
-
-                    # Reduce available slots ONLY after successful payment
-                    package = investment.package
-                    package.available_slots -= 1
-                    package.save()
-                    
-                    # Create transaction record
-                    Transaction.objects.create(
-                        user=payment.user,
-                        investment=investment,
-                        transaction_type='investment',
-                        amount=payment.amount,
-                        status='completed',
-                        payment_method=payment.payment_method,
-                        payment_reference=reference,
-                        description=f'Payment for {investment.package.name}'
-                    )
+                _, outcome = finalize_successful_payment(
+                    {'paystack_reference': reference}, 'paystack_data', data
+                )
                 
-                return Response({'status': 'success'})
+                # Marked only after commit, so a failed attempt is still retried by Paystack.
+                # A sold-out charge is acknowledged too and left for a manual refund
+                cache.set(seen_key, True, PAYSTACK_SEEN_TIMEOUT)
+                return Response({'status': 'success' if outcome == 'applied' else outcome})
             
             return Response({'status': 'ignored'})
             
@@ -889,21 +985,22 @@ class PaystackWebhookView(APIView):
         except Exception as e:
             return Response({'error': str(e)}, status=500)
     
-    def verify_signature(self, body, signature, secret_key):
+    def verify_signature(self, body, signature):
         """Verify Paystack webhook signature"""
-        import hmac
-        import hashlib
+        if not signature or not PAYSTACK_SECRET:
+            return False
         
-        if not signature or not secret_key:
+        # Compare the 64 raw digest bytes instead of two 128-char hex strings
+        try:
+            signature_bytes = bytes.fromhex(signature)
+        except ValueError:
             return False
         
-        expected_signature = hmac.new(
-            secret_key.encode('utf-8'),
-            body,
-            hashlib.sha512
-        ).hexdigest()
+        mac = PAYSTACK_HMAC.copy()
+        mac.update(body)
+        expected_signature = mac.digest()
         
-        return hmac.compare_digest(expected_signature, signature)
+        return hmac.compare_digest(expected_signature, signature_bytes)
 
 
 class WithdrawalRequestViewSet(viewsets.ModelViewSet):
@@ -929,12 +1026,6 @@ class WithdrawalRequestViewSet(viewsets.ModelViewSet):
             withdrawal_request__isnull=True
         )
         
-        if not completed_investments.exists():
-            return Response(
-                {'error': 'No completed investments available for withdrawal'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
         withdrawal_type = serializer.validated_data['type']
         investment_ids = serializer.validated_data.get('investment_ids', [])
         
@@ -943,14 +1034,25 @@ class WithdrawalRequestViewSet(viewsets.ModelViewSet):
         else:
             investments = completed_investments
         
-        if not investments.exists():
+        # One query for both the emptiness check and the totals
+        totals = investments.aggregate(
+            count=Count('id'), total=Sum('actual_return'), principal=Sum('amount')
+        )
+        
+        if not totals['count']:
+            # Only the error path needs to tell "nothing completed" from "bad selection"
+            if not investment_ids or not completed_investments.exists():
+                return Response(
+                    {'error': 'No completed investments available for withdrawal'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
             return Response(
                 {'error': 'No valid investments selected'},
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        total_amount = sum(inv.actual_return for inv in investments)
-        principal_amount = sum(inv.amount for inv in investments)
+        total_amount = totals['total'] or 0
+        principal_amount = totals['principal'] or 0
         
         if withdrawal_type == 'interest':
             amount = total_amount - principal_amount
@@ -959,19 +1061,20 @@ class WithdrawalRequestViewSet(viewsets.ModelViewSet):
         else:  # full
             amount = total_amount
         
-        # Create withdrawal first
-        withdrawal = WithdrawalRequest.objects.create(
-            user=user,
-            amount=amount,
-            type=withdrawal_type,
-            status='pending'
-        )
-        
-        # Update each investment to link to this withdrawal
-        investments.update(withdrawal_request=withdrawal)
+        with db_transaction.atomic():
+            # Create withdrawal first
+            withdrawal = WithdrawalRequest.objects.create(
+                user=user,
+                amount=amount,
+                type=withdrawal_type,
+                status='pending'
+            )
+            
+            # Investment.withdrawal_request is the authoritative link (withdrawable filters on it)
+            investments.update(withdrawal_request=withdrawal)
         
-        # Set the many-to-many relationship
-        withdrawal.investments.set(investments)
+        # A new withdrawal has no M2M rows yet; prime the prefetch cache so the serializer doesn't ask
+        withdrawal._prefetched_objects_cache = {'investments': Investment.objects.none()}
         
         output_serializer = WithdrawalRequestSerializer(withdrawal, context={'request': request})
         headers = self.get_success_headers(output_serializer.data)
@@ -982,28 +1085,31 @@ class WithdrawalRequestViewSet(viewsets.ModelViewSet):
 @permission_classes([IsAuthenticated])
 def payment_status(request, investment_id):
     try:
-        # Get investment and verify ownership
-        investment = Investment.objects.get(
+        # Get investment (verifying ownership) and its most recent payment in one query
+        latest_payment = Payment.objects.filter(investment=OuterRef('pk')).order_by('-created_at')
+        investment = Investment.objects.filter(
             id=investment_id,
             user=request.user
-        )
-        
-        # Get most recent payment for this investment
-        payment = Payment.objects.filter(
-            investment=investment
-        ).order_by('-created_at').first()
-        
+        ).values(
+            'status',
+            payment_status=Subquery(latest_payment.values('status')[:1]),
+            payment_amount=Subquery(latest_payment.values('amount')[:1]),
+            payment_date=Subquery(latest_payment.values('paid_at')[:1]),
+        ).get()
+        
+        payment_exists = investment['payment_status'] is not None
         response_data = {
-            'investment_status': investment.status,
-            'payment_exists': payment is not None,
-            'can_withdraw': investment.status == 'completed' and payment and payment.status == 'success',
+            'investment_status': investment['status'],
+            'payment_exists': payment_exists,
+            'can_withdraw': investment['status'] == 'completed' and payment_exists
+                            and investment['payment_status'] == 'success',
         }
         
-        if payment:
+        if payment_exists:
             response_data.update({
-                'payment_status': payment.status,
-                'payment_amount': payment.amount,
-                'payment_date': payment.paid_at,
+                'payment_status': investment['payment_status'],
+                'payment_amount': investment['payment_amount'],
+                'payment_date': investment['payment_date'],
             })
         
         return Response(response_data)
@@ -1024,6 +1130,7 @@ def payment_status(request, investment_id):
 
 @api_view(['POST'])
 @permission_classes([IsAdminUser])
+@db_transaction.atomic
 def process_withdrawal(request, withdrawal_id, action):
     try:
         withdrawal = WithdrawalRequest.objects.select_for_update().get(id=withdrawal_id)
@@ -1034,6 +1141,8 @@ def process_withdrawal(request, withdrawal_id, action):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+        now = timezone.now()
+
         # MARK AS PAID
         if action == 'mark_paid':
             if withdrawal.status != 'approved':
@@ -1041,38 +1150,41 @@ def process_withdrawal(request, withdrawal_id, action):
                     {'error': 'Only approved withdrawals can be marked as paid.'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            withdrawal.status = 'completed'
-            withdrawal.processed_date = timezone.now()
-            withdrawal.admin_notes = (withdrawal.admin_notes or '') + "\nMarked as paid manually by admin."
-            withdrawal.save()
-            return Response(
-                WithdrawalRequestSerializer(withdrawal).data,
-                status=status.HTTP_200_OK
-            )
+            updates = {
+                'status': 'completed',
+                'processed_date': now,
+                'admin_notes': Concat(
+                    'admin_notes', Value("\nMarked as paid manually by admin."), output_field=TextField()
+                ),
+            }
 
         # APPROVE
-        if action == 'approve':
+        elif action == 'approve':
             if withdrawal.status != 'pending' and withdrawal.status != 'failed':
                 return Response(
                     {'error': f'Withdrawal is already {withdrawal.status}'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            withdrawal.status = 'approved'
-            withdrawal.processed_date = timezone.now()
-            withdrawal.payment_reference = f"PAY-{int(timezone.now().timestamp())}"
+            updates = {'status': 'approved', 'processed_date': now}
 
         # REJECT
-        elif action == 'reject':
+        else:
             if withdrawal.status != 'pending':
                 return Response(
                     {'error': f'Withdrawal is already {withdrawal.status}'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            withdrawal.status = 'rejected'
-            withdrawal.processed_date = timezone.now()
-            withdrawal.admin_notes = (withdrawal.admin_notes or '') + "\nRejected by admin."
+            updates = {
+                'status': 'rejected',
+                'processed_date': now,
+                'admin_notes': Concat(
+                    'admin_notes', Value("\nRejected by admin."), output_field=TextField()
+                ),
+            }
 
-        withdrawal.save()
+        # Write only the touched columns, then reload them for the response
+        WithdrawalRequest.objects.filter(pk=withdrawal.pk).update(**updates)
+        withdrawal.refresh_from_db(fields=list(updates))
         return Response(
             WithdrawalRequestSerializer(withdrawal).data,
             status=status.HTTP_200_OK
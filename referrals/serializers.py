@@ -5,7 +5,8 @@ class ReferralCodeSerializer(serializers.ModelSerializer):
     """Serializer for ReferralCode model"""
     
     user_email = serializers.CharField(source='user.email', read_only=True)
-    user_name = serializers.SerializerMethodField()
+    # Annotated in SQL by the views (see referrals.views.display_name)
+    user_name = serializers.CharField(read_only=True)
     
     class Meta:
         model = ReferralCode
@@ -14,16 +15,14 @@ class ReferralCodeSerializer(serializers.ModelSerializer):
             'created_at', 'updated_at'
         ]
         read_only_fields = ['user', 'code']
-    
-    def get_user_name(self, obj):
-        return f"{obj.user.first_name} {obj.user.last_name}".strip() or obj.user.email
 
 class ReferralSerializer(serializers.ModelSerializer):
     """Serializer for Referral model"""
     
     referrer_email = serializers.CharField(source='referrer.email', read_only=True)
     referred_user_email = serializers.CharField(source='referred_user.email', read_only=True)
-    referred_user_name = serializers.SerializerMethodField()
+    # Annotated in SQL by the views (see referrals.views.display_name)
+    referred_user_name = serializers.CharField(read_only=True)
     referral_code_code = serializers.CharField(source='referral_code.code', read_only=True)
     
     class Meta:
@@ -34,9 +33,6 @@ class ReferralSerializer(serializers.ModelSerializer):
             'commission_rate', 'created_at', 'activated_at', 'completed_at'
         ]
         read_only_fields = ['referrer', 'referral_code']
-    
-    def get_referred_user_name(self, obj):
-        return f"{obj.referred_user.first_name} {obj.referred_user.last_name}".strip() or obj.referred_user.email
 
 class ReferralEarningSerializer(serializers.ModelSerializer):
     """Serializer for ReferralEarning model"""
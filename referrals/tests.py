@@ -1,3 +1,143 @@
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from investments.models import Investment, InvestmentPackage
+
+from .models import Referral, ReferralCode, ReferralEarning
+from .views import ReferralCodeViewSet
+
+
+class ReferralTestCase(TestCase):
+    def setUp(self):
+        self.referrer = get_user_model().objects.create_user(
+            email='referrer@example.com', password='pass', first_name='Ann', last_name='Ade'
+        )
+        self.code = ReferralCode.objects.create(user=self.referrer)
+        self.package = InvestmentPackage.objects.create(
+            name='Grain Fund', description='d', category='grains', risk_level='low',
+            min_amount=10, max_amount=1000, interest_rate=Decimal('10'), duration_months=1,
+            total_slots=10, available_slots=10,
+            start_date=date.today(), end_date=date.today() + timedelta(days=30),
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.referrer)
+
+    def add_referral(self, **user_fields):
+        index = Referral.objects.count()
+        referred = get_user_model().objects.create_user(
+            email=f'referred{index}@example.com', password='pass', **user_fields
+        )
+        referral = Referral.objects.create(referrer=self.referrer, referred_user=referred, referral_code=self.code)
+        investment = Investment.objects.create(
+            user=referred, package=self.package, amount=Decimal('100'),
+            start_date=date.today(), end_date=date.today() + timedelta(days=30),
+        )
+        ReferralEarning.objects.create(
+            referral=referral, investment=investment, amount=Decimal('5'), commission_rate=Decimal('5')
+        )
+        return referral
+
+
+class ReferralQueryCountTests(ReferralTestCase):
+    def test_list_queries_do_not_grow_with_rows(self):
+        self.add_referral()
+        for url in (
+            '/api/referrals/referrals/',
+            '/api/referrals/earnings/',
+            '/api/referrals/earnings/recent/',
+            '/api/referrals/dashboard/',
+        ):
+            with CaptureQueriesContext(connection) as before:
+                self.assertEqual(self.client.get(url).status_code, 200)
+            for _ in range(3):
+                self.add_referral()
+            with CaptureQueriesContext(connection) as after:
+                response = self.client.get(url)
+
+            self.assertEqual(len(after), len(before), url)
+            self.assertGreater(len(response.data), 0)
+
+    def test_earning_rows_carry_joined_fields(self):
+        self.add_referral()
+
+        row = self.client.get('/api/referrals/earnings/').data[0]
+
+        self.assertEqual(row['referral_referrer_email'], 'referrer@example.com')
+        self.assertEqual(row['investment_package_name'], 'Grain Fund')
+        self.assertEqual(row['investment_amount'], '100.00')
+
+
+class ReferralDisplayNameTests(ReferralTestCase):
+    def test_referred_user_name_joins_first_and_last(self):
+        self.add_referral(first_name='Bola', last_name='Ojo')
+
+        response = self.client.get('/api/referrals/referrals/')
+
+        self.assertEqual(response.data[0]['referred_user_name'], 'Bola Ojo')
+
+    def test_blank_names_fall_back_to_email(self):
+        referral = self.add_referral()
+
+        listed = self.client.get('/api/referrals/referrals/').data[0]
+        dashboard = self.client.get('/api/referrals/dashboard/').data['recent_referrals'][0]
+
+        self.assertEqual(listed['referred_user_name'], referral.referred_user.email)
+        self.assertEqual(dashboard['referred_user_name'], referral.referred_user.email)
+
+    def test_code_user_name_on_every_code_endpoint(self):
+        self.assertEqual(self.client.get('/api/referrals/codes/my_code/').data['user_name'], 'Ann Ade')
+        self.assertEqual(
+            self.client.post(f'/api/referrals/codes/{self.code.pk}/regenerate/').data['user_name'], 'Ann Ade'
+        )
+
+    def test_code_created_on_demand_uses_email(self):
+        newcomer = get_user_model().objects.create_user(email='new@example.com', password='pass')
+        client = APIClient()
+        client.force_authenticate(newcomer)
+
+        self.assertEqual(client.get('/api/referrals/codes/my_code/').data['user_name'], 'new@example.com')
+        self.assertEqual(client.get('/api/referrals/dashboard/').data['referral_code']['user_name'], 'new@example.com')
+
+
+
+class ReferralCodeRaceTests(ReferralTestCase):
+    def setUp(self):
+        super().setUp()
+        # The code already exists, but each test makes the view's first lookup miss it,
+        # as when a concurrent request creates it in between
+        self.racer = get_user_model().objects.create_user(email='racer@example.com', password='pass')
+        self.racer_code = ReferralCode.objects.create(user=self.racer)
+        self.racer_client = APIClient()
+        self.racer_client.force_authenticate(self.racer)
+
+    def test_dashboard_reuses_code_created_meanwhile(self):
+        with mock.patch('django.db.models.query.QuerySet.first', return_value=None):
+            response = self.racer_client.get('/api/referrals/dashboard/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['referral_code']['code'], self.racer_code.code)
+        self.assertEqual(response.data['referral_code']['user_name'], 'racer@example.com')
+
+    def test_my_code_reuses_code_created_meanwhile(self):
+        get_queryset = ReferralCodeViewSet.get_queryset
+        missed = []
+
+        def miss_once(viewset):
+            if not missed:
+                missed.append(True)
+                return ReferralCode.objects.none()
+            return get_queryset(viewset)
+
+        with mock.patch.object(ReferralCodeViewSet, 'get_queryset', miss_once):
+            response = self.racer_client.get('/api/referrals/codes/my_code/')
 
-# Create your tests here.
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['code'], self.racer_code.code)
+        self.assertEqual(ReferralCode.objects.filter(user=self.racer).count(), 1)
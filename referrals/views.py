@@ -3,10 +3,13 @@ from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from django.db.models import Sum, Count
+from django.db.models import CharField, Count, Sum, Value
+from django.db.models.functions import Coalesce, Concat, NullIf, Trim
 from django.utils import timezone
 from datetime import timedelta
 
+from investments.mixins import AutoPrefetchMixin
+
 from .models import ReferralCode, Referral, ReferralEarning, ReferralBonus
 from .serializers import (
     ReferralCodeSerializer,
@@ -16,30 +19,46 @@ from .serializers import (
     ReferralStatsSerializer
 )
 
-class ReferralCodeViewSet(viewsets.ModelViewSet):
+def display_name(user_path):
+    """SQL for "first last", falling back to the email when both names are blank"""
+    return Coalesce(
+        NullIf(
+            Trim(Concat(f'{user_path}__first_name', Value(' '), f'{user_path}__last_name')),
+            Value('')
+        ),
+        f'{user_path}__email',
+        output_field=CharField()
+    )
+
+
+class ReferralCodeViewSet(AutoPrefetchMixin, viewsets.ModelViewSet):
     """ViewSet for managing referral codes"""
     
     permission_classes = [IsAuthenticated]
     serializer_class = ReferralCodeSerializer
+    queryset = ReferralCode.objects.all()
     
     def get_queryset(self):
-        return ReferralCode.objects.filter(user=self.request.user)
+        return super().get_queryset().filter(user=self.request.user).annotate(
+            user_name=display_name('user')
+        )
     
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        referral_code = serializer.save(user=self.request.user)
+        # Reload through get_queryset so the response carries the annotated user_name
+        serializer.instance = self.get_queryset().get(pk=referral_code.pk)
     
     @action(detail=False, methods=['get'])
     def my_code(self, request):
         """Get current user's referral code"""
         try:
-            referral_code = ReferralCode.objects.get(user=request.user)
-            serializer = self.get_serializer(referral_code)
-            return Response(serializer.data)
+            referral_code = self.get_queryset().get()
         except ReferralCode.DoesNotExist:
-            # Create referral code if it doesn't exist
-            referral_code = ReferralCode.objects.create(user=request.user)
-            serializer = self.get_serializer(referral_code)
-            return Response(serializer.data)
+            # Create referral code if it doesn't exist; get_or_create survives a concurrent first visit
+            ReferralCode.objects.get_or_create(user=request.user)
+            referral_code = self.get_queryset().get()
+        serializer = self.get_serializer(referral_code)
+        return Response(serializer.data)
     
     @action(detail=True, methods=['post'])
     def regenerate(self, request, pk=None):
@@ -50,14 +69,17 @@ class ReferralCodeViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(referral_code)
         return Response(serializer.data)
 
-class ReferralViewSet(viewsets.ReadOnlyModelViewSet):
+class ReferralViewSet(AutoPrefetchMixin, viewsets.ReadOnlyModelViewSet):
     """ViewSet for viewing referrals"""
     
     permission_classes = [IsAuthenticated]
     serializer_class = ReferralSerializer
+    queryset = Referral.objects.all()
     
     def get_queryset(self):
-        return Referral.objects.filter(referrer=self.request.user)
+        return super().get_queryset().filter(referrer=self.request.user).annotate(
+            referred_user_name=display_name('referred_user')
+        )
     
     @action(detail=False, methods=['get'])
     def stats(self, request):
@@ -127,14 +149,15 @@ class ReferralViewSet(viewsets.ReadOnlyModelViewSet):
         
         return Response(earnings_data[::-1])  # Reverse to show oldest first
 
-class ReferralEarningViewSet(viewsets.ReadOnlyModelViewSet):
+class ReferralEarningViewSet(AutoPrefetchMixin, viewsets.ReadOnlyModelViewSet):
     """ViewSet for viewing referral earnings"""
     
     permission_classes = [IsAuthenticated]
     serializer_class = ReferralEarningSerializer
+    queryset = ReferralEarning.objects.all()
     
     def get_queryset(self):
-        return ReferralEarning.objects.filter(referral__referrer=self.request.user)
+        return super().get_queryset().filter(referral__referrer=self.request.user)
     
     @action(detail=False, methods=['get'])
     def recent(self, request):
@@ -182,7 +205,14 @@ class ReferralDashboardView(APIView):
         user = request.user
         
         # Get or create referral code
-        referral_code, created = ReferralCode.objects.get_or_create(user=user)
+        referral_codes = ReferralCode.objects.filter(user=user).select_related('user').annotate(
+            user_name=display_name('user')
+        )
+        referral_code = referral_codes.first()
+        if referral_code is None:
+            # get_or_create survives a concurrent first visit; re-read for the annotated user_name
+            ReferralCode.objects.get_or_create(user=user)
+            referral_code = referral_codes.get()
         
         # Get referral statistics
         referrals = Referral.objects.filter(referrer=user)
@@ -201,12 +231,16 @@ class ReferralDashboardView(APIView):
         ).aggregate(total=Sum('amount'))['total'] or 0
         
         # Get recent referrals
-        recent_referrals = referrals.order_by('-created_at')[:5]
+        recent_referrals = referrals.select_related(
+            'referrer', 'referred_user', 'referral_code'
+        ).annotate(
+            referred_user_name=display_name('referred_user')
+        ).order_by('-created_at')[:5]
         
         # Get recent earnings
         recent_earnings = ReferralEarning.objects.filter(
             referral__referrer=user
-        ).order_by('-created_at')[:5]
+        ).select_related('referral__referrer', 'investment__package').order_by('-created_at')[:5]
         
         return Response({
             'referral_code': ReferralCodeSerializer(referral_code).data,
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.2 on 2026-10-15 14:47
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('storage', '0003_alter_storageplan_product_image_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='storageinvestment',
+            index=models.Index(fields=['user', 'status'], name='storage_inv_user_status'),
+        ),
+        migrations.AddIndex(
+            model_name='storageinvestment',
+            index=models.Index(fields=['user', '-created_at'], name='storage_inv_user_created'),
+        ),
+        migrations.AddIndex(
+            model_name='storageplan',
+            index=models.Index(fields=['is_active', 'available_quantity'], name='plan_active_available'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+from django.db import migrations
+
+
+# Matches the UPPER(...) LIKE UPPER('%...%') that product_name__icontains compiles to on PostgreSQL
+CREATE_TRGM_INDEX = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX IF NOT EXISTS storageplan_name_trgm ON storage_storageplan '
+    'USING gin ((UPPER(product_name::text)) gin_trgm_ops)',
+]
+DROP_TRGM_INDEX = ['DROP INDEX IF EXISTS storageplan_name_trgm']
+
+
+def run_on_postgresql(statements):
+    def operation(apps, schema_editor):
+        # Trigram indexes are PostgreSQL-only; other backends keep the plain scan
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for sql in statements:
+            schema_editor.execute(sql)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('storage', '0004_storage_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_on_postgresql(CREATE_TRGM_INDEX), run_on_postgresql(DROP_TRGM_INDEX)),
+    ]
@@ -41,6 +41,9 @@ class StoragePlan(models.Model):
         ordering = ['-created_at']
         verbose_name = "Storage Plan"
         verbose_name_plural = "Storage Plans"
+        indexes = [
+            models.Index(fields=['is_active', 'available_quantity'], name='plan_active_available'),
+        ]
 
     def __str__(self):
         return f"{self.product_name} - ₦{self.buying_price_per_bag}/bag"
@@ -115,6 +118,10 @@ class StorageInvestment(models.Model):
         ordering = ['-created_at']
         verbose_name = "Investment"
         verbose_name_plural = "Investments"
+        indexes = [
+            models.Index(fields=['user', 'status'], name='storage_inv_user_status'),
+            models.Index(fields=['user', '-created_at'], name='storage_inv_user_created'),
+        ]
 
     def __str__(self):
         return f"{self.customer_name} - {self.storage_plan.product_name} ({self.quantity_bags} bags)"
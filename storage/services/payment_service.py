@@ -1,5 +1,5 @@
 import requests
-import uuid
+import secrets
 from django.conf import settings
 from decimal import Decimal
 from ..models import PaymentTransaction
@@ -22,7 +22,8 @@ class PaymentService:
     
     def generate_reference(self):
         """Generate unique payment reference"""
-        return f"AGR_{uuid.uuid4().hex[:12].upper()}"
+        # 48 random bits straight from os.urandom, same AGR_XXXXXXXXXXXX shape as before
+        return f"AGR_{secrets.token_hex(6).upper()}"
     
     def create_payment(self, investment):
         """Create payment transaction and initialize payment with Paystack"""
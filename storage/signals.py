@@ -0,0 +1,41 @@
+import uuid
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import StoragePlan
+
+# Serialized plan-list responses, keyed by list version and a hash of the request's filters
+STORAGE_PLAN_LIST_CACHE_KEY = 'storage:plan_list:{}:{}'
+
+# Replaced on every plan write so all cached plan-list responses are skipped at once
+STORAGE_PLAN_LIST_VERSION_KEY = 'storage:plan_list:version'
+
+# Writes bump this process's version at once; the timeout bounds how stale other workers get
+STORAGE_PLAN_LIST_TIMEOUT = 60
+
+# Columns StoragePlanSerializer reads, including those behind roi_percentage/is_available
+STORAGE_PLAN_LIST_FIELDS = (
+    'id', 'product_name', 'product_image', 'description',
+    'buying_price_per_bag', 'projected_selling_price', 'storage_due_date',
+    'available_quantity', 'minimum_quantity', 'maximum_quantity',
+    'is_active', 'created_at',
+)
+
+
+def storage_plan_list_version():
+    """Return the current plan-list version, starting one if none is cached"""
+    return cache.get_or_set(STORAGE_PLAN_LIST_VERSION_KEY, lambda: uuid.uuid4().hex, None)
+
+
+def bump_storage_plan_list_version():
+    """Start a new plan-list version, orphaning every cached plan-list response"""
+    cache.set(STORAGE_PLAN_LIST_VERSION_KEY, uuid.uuid4().hex, None)
+
+
+@receiver([post_save, post_delete], sender=StoragePlan)
+def invalidate_storage_plan_list(sender, **kwargs):
+    """Expire cached plan lists once the write commits (admin edits, reservations, deletes)"""
+    transaction.on_commit(bump_storage_plan_list_version)
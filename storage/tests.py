@@ -1,3 +1,158 @@
+import hashlib
+import hmac
+import json
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.test import TestCase
+from rest_framework.test import APIClient
+
+from .models import PaymentTransaction, StorageInvestment, StoragePlan
+
+PLANS_URL = '/api/storage/storage-plans/'
+
+
+class StorageTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        User = get_user_model()
+        self.user = User.objects.create_user(email='farmer@example.com', password='pass')
+        self.admin = User.objects.create_superuser(email='admin@example.com', password='pass')
+        self.plan = self.create_plan('Maize')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.admin_client = APIClient()
+        self.admin_client.force_authenticate(self.admin)
+
+    def create_plan(self, product_name, **fields):
+        return StoragePlan.objects.create(
+            product_name=product_name, description='d',
+            buying_price_per_bag=Decimal('100'), projected_selling_price=Decimal('150'),
+            storage_due_date=date.today() + timedelta(days=30),
+            **{'available_quantity': 50, **fields}
+        )
+
+    def create_investment(self, reference, quantity_bags=2, **fields):
+        investment = StorageInvestment.objects.create(
+            user=self.user, storage_plan=self.plan, customer_name='Farmer', customer_email='farmer@example.com',
+            quantity_bags=quantity_bags, price_per_bag=Decimal('100'),
+            total_investment_amount=Decimal('100') * quantity_bags,
+            projected_selling_price_per_bag=Decimal('150'), **fields
+        )
+        PaymentTransaction.objects.create(
+            investment=investment, reference=reference, amount=investment.total_investment_amount
+        )
+        return investment
+
+    def webhook(self, event, reference):
+        body = json.dumps({'event': event, 'data': {'reference': reference, 'id': 1}}).encode()
+        signature = hmac.new(settings.PAYSTACK_SECRET_KEY.encode(), body, hashlib.sha512).hexdigest()
+        with self.captureOnCommitCallbacks(execute=True):
+            return APIClient().post(
+                '/api/storage/webhooks/paystack/', body,
+                content_type='application/json', HTTP_X_PAYSTACK_SIGNATURE=signature
+            )
+
+
+class StoragePlanListTests(StorageTestCase):
+    def setUp(self):
+        super().setUp()
+        self.sold_out = self.create_plan('Sorghum', available_quantity=0)
+        self.inactive = self.create_plan('Millet', is_active=False)
+
+    def names(self, response):
+        return sorted(plan['product_name'] for plan in response.data)
+
+    def test_filters_by_visibility_name_and_availability(self):
+        self.assertEqual(self.names(self.client.get(PLANS_URL)), ['Maize'])
+        self.assertEqual(self.names(self.admin_client.get(PLANS_URL)), ['Maize', 'Millet'])
+        self.assertEqual(
+            self.names(self.client.get(PLANS_URL, {'available_only': 'false'})), ['Maize', 'Sorghum']
+        )
+        self.assertEqual(self.names(self.client.get(PLANS_URL, {'product_name': 'aiz'})), ['Maize'])
+        self.assertEqual(self.names(self.client.get(PLANS_URL, {'product_name': 'millet'})), [])
+
+    def test_warm_request_skips_the_database(self):
+        first = self.client.get(PLANS_URL)
+
+        with self.assertNumQueries(0):
+            second = self.client.get(PLANS_URL)
+
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second['ETag'], first['ETag'])
+        self.assertFalse(second.has_header('Last-Modified'))
+
+    def test_matching_etag_is_not_modified(self):
+        etag = self.client.get(PLANS_URL)['ETag']
+
+        response = self.client.get(PLANS_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+
+    def test_save_and_delete_invalidate_the_list(self):
+        etag = self.client.get(PLANS_URL)['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_plan('Rice')
+        response = self.client.get(PLANS_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.names(response), ['Maize', 'Rice'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.plan.delete()
+        response = self.client.get(PLANS_URL, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.names(response), ['Rice'])
+
+    def test_failed_charge_release_invalidates_the_list(self):
+        self.create_investment('ref-failed', quantity_bags=5)
+        self.client.get(PLANS_URL)
+
+        self.assertEqual(self.webhook('charge.failed', 'ref-failed').status_code, 200)
+
+        plan = next(plan for plan in self.client.get(PLANS_URL).data if plan['id'] == str(self.plan.pk))
+        self.assertEqual(plan['available_quantity'], 55)
+
+
+class PaymentConfirmationTests(StorageTestCase):
+    def setUp(self):
+        super().setUp()
+        self.investment = self.create_investment('ref-paid')
+
+    def make_due(self):
+        # save() would cancel a pending investment created past due, so backdate in SQL
+        StorageInvestment.objects.filter(pk=self.investment.pk).update(due_date=date.today())
+
+    def verify(self):
+        with mock.patch('storage.views.PaymentService.verify_payment', return_value={'status': 'success'}):
+            with self.captureOnCommitCallbacks(execute=True):
+                return self.client.post('/api/storage/payment/verify/', {'reference': 'ref-paid'}, format='json')
+
+    def test_webhook_activates_investment_before_due_date(self):
+        self.webhook('charge.success', 'ref-paid')
+
+        self.investment.refresh_from_db()
+        self.assertEqual(self.investment.status, 'active')
+        self.assertEqual(self.investment.payment_status, 'paid')
+
+    def test_webhook_matures_investment_already_due(self):
+        self.make_due()
+
+        self.webhook('charge.success', 'ref-paid')
+
+        self.investment.refresh_from_db()
+        self.assertEqual(self.investment.status, 'matured')
+
+    def test_verify_matures_investment_already_due(self):
+        self.make_due()
+
+        response = self.verify()
 
-# Create your tests here.
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['investment']['status'], 'matured')
+        self.investment.refresh_from_db()
+        self.assertEqual(self.investment.status, 'matured')
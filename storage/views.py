@@ -2,14 +2,23 @@ from rest_framework import status, generics, permissions
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
+from django.conf import settings
 from django.shortcuts import get_object_or_404
-from django.db.models import Sum, Avg, Count, Q
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Sum, Avg, Case, Count, DecimalField, F, Q, Value, When
+from django.db.models.functions import Coalesce, Now, NullIf
 from django.contrib.auth import authenticate, login
 from django.contrib.auth.models import User
-from datetime import date, datetime
+from datetime import date
+from decimal import Decimal
 import uuid
 import hashlib
 import hmac
+import json
+from functools import partial
 
 from .models import StoragePlan, StorageInvestment, PaymentTransaction, StorageUpdate
 from .serilizers import (
@@ -17,6 +26,57 @@ from .serilizers import (
     PaymentTransactionSerializer, DashboardStatsSerializer
 )
 from .services.payment_service import PaymentService
+from .signals import (
+    STORAGE_PLAN_LIST_CACHE_KEY, STORAGE_PLAN_LIST_FIELDS, STORAGE_PLAN_LIST_TIMEOUT,
+    bump_storage_plan_list_version, storage_plan_list_version
+)
+
+
+# Webhook signing key, encoded once rather than on every request
+PAYSTACK_SECRET = getattr(settings, 'PAYSTACK_SECRET_KEY', '').encode('utf-8')
+
+# Keyed HMAC state; copy() per webhook skips re-deriving the key pads. Never update() it directly
+PAYSTACK_HMAC = hmac.new(PAYSTACK_SECRET, digestmod=hashlib.sha512)
+
+# Webhook events paystack_webhook acts on; anything else is acknowledged unverified
+PAYSTACK_HANDLED_EVENTS = frozenset({'charge.success', 'charge.failed'})
+
+# Per-user dashboard stats, dropped whenever one of the user's investments changes state
+DASHBOARD_STATS_CACHE_KEY = 'storage:dashboard_stats:{}'
+DASHBOARD_STATS_TIMEOUT = 60
+
+
+# Columns InvestmentSerializer reads, including the joined storage plan
+STORAGE_INVESTMENT_LIST_FIELDS = (
+    'id', 'storage_plan', 'customer_name', 'customer_email', 'customer_phone',
+    'quantity_bags', 'price_per_bag', 'total_investment_amount',
+    'projected_selling_price_per_bag', 'projected_returns', 'status',
+    'purchase_date', 'due_date', 'completion_date', 'payment_reference',
+    'payment_status', 'created_at',
+) + tuple(f'storage_plan__{field}' for field in STORAGE_PLAN_LIST_FIELDS)
+
+
+def create_storage_update(investment_id, update_type, title, message):
+    """Insert a StorageUpdate; scheduled with transaction.on_commit to keep it out of row-locked blocks"""
+    StorageUpdate.objects.create(
+        investment_id=investment_id,
+        update_type=update_type,
+        title=title,
+        message=message
+    )
+
+
+def paid_investment_status():
+    """SQL status for a just-paid investment, matured when already due as StorageInvestment.save() would set"""
+    return Case(
+        When(due_date__lte=date.today(), then=Value('matured')),
+        default=Value('active')
+    )
+
+
+def invalidate_dashboard_stats(user_id):
+    """Forget the cached dashboard stats for ``user_id``"""
+    cache.delete(DASHBOARD_STATS_CACHE_KEY.format(user_id))
 
 
 class StoragePlanListView(generics.ListCreateAPIView):
@@ -60,8 +120,38 @@ class StoragePlanListView(generics.ListCreateAPIView):
         if available_only.lower() == 'true':
             queryset = queryset.filter(available_quantity__gt=0)
         
-        return queryset.order_by('-created_at')
+        return queryset.only(*STORAGE_PLAN_LIST_FIELDS).order_by('-created_at')
     
+    def list(self, request, *args, **kwargs):
+        """Serve the serialized plan list from cache, keyed on everything get_queryset filters by"""
+        user = request.user
+        variant = '|'.join([
+            str(user.is_staff or user.is_superuser),
+            # product_image is rendered as an absolute URL
+            request.build_absolute_uri('/'),
+            request.query_params.get('product_name', ''),
+            request.query_params.get('available_only', 'true').lower(),
+        ])
+        cache_key = STORAGE_PLAN_LIST_CACHE_KEY.format(
+            storage_plan_list_version(), hashlib.md5(variant.encode()).hexdigest()
+        )
+
+        entry = cache.get(cache_key)
+        if entry is None:
+            plans = self.get_serializer(self.get_queryset(), many=True).data
+            content = json.dumps(plans, sort_keys=True, default=str).encode()
+            entry = {'plans': list(plans), 'etag': quote_etag(hashlib.md5(content).hexdigest())}
+            cache.set(cache_key, entry, STORAGE_PLAN_LIST_TIMEOUT)
+
+        # ETag only: a content hash also changes when a plan is deleted, a timestamp would not
+        not_modified = get_conditional_response(request, etag=entry['etag'])
+        if not_modified is not None:
+            return not_modified
+
+        response = Response(entry['plans'])
+        response['ETag'] = entry['etag']
+        return response
+
     def perform_create(self, serializer):
         """Save the new storage plan"""
         serializer.save()
@@ -88,6 +178,7 @@ def purchase_storage_plan(request):
         try:
             # Create investment
             investment = serializer.save()
+            invalidate_dashboard_stats(investment.user_id)
             
             # Create payment transaction
             payment_service = PaymentService()
@@ -121,7 +212,11 @@ class MyInvestmentsView(generics.ListAPIView):
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        queryset = StorageInvestment.objects.filter(user=self.request.user)
+        queryset = StorageInvestment.objects.filter(
+            user=self.request.user
+        ).select_related('storage_plan').prefetch_related('updates').only(
+            *STORAGE_INVESTMENT_LIST_FIELDS
+        )
         
         # Filter by status
         status_filter = self.request.query_params.get('status')
@@ -137,96 +232,109 @@ class InvestmentDetailView(generics.RetrieveAPIView):
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return StorageInvestment.objects.filter(user=self.request.user)
+        return StorageInvestment.objects.filter(
+            user=self.request.user
+        ).select_related('storage_plan').prefetch_related('updates')
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def dashboard_stats(request):
     """Get dashboard statistics for the current user"""
-    user_investments = StorageInvestment.objects.filter(user=request.user)
-    
-    # Calculate statistics
-    stats = {
-        'total_investments': user_investments.count(),
-        'total_invested_amount': user_investments.aggregate(
-            total=Sum('total_investment_amount')
-        )['total'] or 0,
-        'total_projected_returns': user_investments.aggregate(
-            total=Sum('projected_returns')
-        )['total'] or 0,
-        'active_investments': user_investments.filter(status='active').count(),
-        'pending_investments': user_investments.filter(status='pending').count(),
-        'matured_investments': user_investments.filter(status='matured').count(),
-        'completed_investments': user_investments.filter(status='completed').count(),
-    }
-    
-    # Calculate average ROI
-    if stats['total_invested_amount'] > 0:
-        stats['average_roi'] = round(
-            ((stats['total_projected_returns'] - stats['total_invested_amount']) 
-             / stats['total_invested_amount']) * 100, 2
-        )
-    else:
-        stats['average_roi'] = 0
+    cache_key = DASHBOARD_STATS_CACHE_KEY.format(request.user.id)
+    data = cache.get(cache_key)
+    if data is not None:
+        return Response(data)
+
+    # All counters, totals and the ROI in one scan of the user's investments
+    invested = Sum('total_investment_amount')
+    projected = Sum('projected_returns')
+    stats = StorageInvestment.objects.filter(user=request.user).aggregate(
+        total_investments=Count('id'),
+        total_invested_amount=Coalesce(invested, Decimal('0')),
+        total_projected_returns=Coalesce(projected, Decimal('0')),
+        active_investments=Count('id', filter=Q(status='active')),
+        pending_investments=Count('id', filter=Q(status='pending')),
+        matured_investments=Count('id', filter=Q(status='matured')),
+        completed_investments=Count('id', filter=Q(status='completed')),
+        # NULL (no investments / nothing invested) falls back to 0; the serializer rounds
+        average_roi=Coalesce(
+            (projected - invested) * Value(Decimal('100')) / NullIf(invested, Value(Decimal('0'))),
+            Value(Decimal('0')),
+            output_field=DecimalField(max_digits=15, decimal_places=2),
+        ),
+    )
     
-    serializer = DashboardStatsSerializer(stats)
-    return Response(serializer.data)
+    data = dict(DashboardStatsSerializer(stats).data)
+    cache.set(cache_key, data, DASHBOARD_STATS_TIMEOUT)
+    return Response(data)
 
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
 def paystack_webhook(request):
     """Handle Paystack webhook for payment verification"""
-    import json
-    from django.conf import settings
-    
     # Verify webhook signature
     signature = request.headers.get('x-paystack-signature')
     if not signature:
         return Response({'error': 'No signature'}, status=400)
     
     payload = request.body
-    computed_signature = hmac.new(
-        settings.PAYSTACK_SECRET_KEY.encode('utf-8'),
-        payload,
-        hashlib.sha512
-    ).hexdigest()
     
-    if signature != computed_signature:
+    # Parse once; events we don't act on are acknowledged without hashing the body
+    try:
+        data = json.loads(payload)
+    except ValueError:
+        return Response({'error': 'Invalid payload'}, status=400)
+    event = data.get('event') if isinstance(data, dict) else None
+    if event not in PAYSTACK_HANDLED_EVENTS:
+        return Response({'status': 'ignored'})
+    
+    mac = PAYSTACK_HMAC.copy()
+    mac.update(payload)
+    computed_signature = mac.hexdigest()
+    
+    # Constant-time compare; bytes so a non-ASCII header can't raise TypeError
+    if not hmac.compare_digest(signature.encode(), computed_signature.encode()):
         return Response({'error': 'Invalid signature'}, status=400)
     
     try:
-        data = json.loads(payload)
-        event = data.get('event')
-        
         if event == 'charge.success':
             reference = data['data']['reference']
             
             try:
-                payment_transaction = PaymentTransaction.objects.get(reference=reference)
-                investment = payment_transaction.investment
-                
-                # Update payment status
-                payment_transaction.status = 'successful'
-                payment_transaction.gateway_reference = data['data']['id']
-                payment_transaction.paid_at = datetime.now()
-                payment_transaction.save()
-                
-                # Update investment status
-                investment.status = 'active'
-                investment.payment_status = 'paid'
-                investment.payment_date = datetime.now()
-                investment.payment_reference = reference
-                investment.save()
-                
-                # Create storage update
-                StorageUpdate.objects.create(
-                    investment=investment,
-                    update_type='storage_start',
-                    title='Payment Confirmed - Storage Started',
-                    message=f'Your payment of ₦{payment_transaction.amount:,.2f} has been confirmed. Your {investment.product_name} storage has officially started.'
-                )
+                with transaction.atomic():
+                    # Lock the payment row so concurrent Paystack retries apply it only once
+                    payment_transaction = PaymentTransaction.objects.select_for_update(
+                        of=('self',)
+                    ).select_related('investment__storage_plan').get(reference=reference)
+                    investment = payment_transaction.investment
+                    
+                    if payment_transaction.status != 'successful':
+                        # Targeted UPDATEs for the changed columns only
+                        PaymentTransaction.objects.filter(pk=payment_transaction.pk).update(
+                            status='successful',
+                            gateway_reference=data['data']['id'],
+                            paid_at=Now(),
+                            updated_at=Now()
+                        )
+                        StorageInvestment.objects.filter(pk=investment.pk).update(
+                            status=paid_investment_status(),
+                            payment_status='paid',
+                            payment_date=Now(),
+                            payment_reference=reference,
+                            updated_at=Now()
+                        )
+                        
+                        # Create storage update once the lock is released
+                        transaction.on_commit(partial(
+                            create_storage_update,
+                            investment.pk,
+                            'storage_start',
+                            'Payment Confirmed - Storage Started',
+                            f'Your payment of ₦{payment_transaction.amount:,.2f} has been confirmed. Your {investment.product_name} storage has officially started.'
+                        ))
+                invalidate_dashboard_stats(investment.user_id)
                 
                 return Response({'status': 'success'})
                 
@@ -237,19 +345,34 @@ def paystack_webhook(request):
             reference = data['data']['reference']
             
             try:
-                payment_transaction = PaymentTransaction.objects.get(reference=reference)
-                investment = payment_transaction.investment
-                
-                # Update payment status
-                payment_transaction.status = 'failed'
-                payment_transaction.save()
-                
-                # Release reserved quantity
-                investment.storage_plan.release_quantity(investment.quantity_bags)
-                
-                # Update investment status
-                investment.status = 'cancelled'
-                investment.save()
+                with transaction.atomic():
+                    # Lock the payment row; the plan is released with F() so it needs no lock
+                    payment_transaction = PaymentTransaction.objects.select_for_update(
+                        of=('self',)
+                    ).select_related('investment').get(reference=reference)
+                    investment = payment_transaction.investment
+                    
+                    # A retried (or late) failure must not release the bags twice
+                    if payment_transaction.status not in ('failed', 'successful'):
+                        PaymentTransaction.objects.filter(pk=payment_transaction.pk).update(
+                            status='failed',
+                            updated_at=Now()
+                        )
+                        
+                        # Release reserved quantity in the database, no read-modify-write
+                        StoragePlan.objects.filter(pk=investment.storage_plan_id).update(
+                            available_quantity=F('available_quantity') + investment.quantity_bags,
+                            updated_at=Now()
+                        )
+                        
+                        StorageInvestment.objects.filter(pk=investment.pk).update(
+                            status='cancelled',
+                            updated_at=Now()
+                        )
+                        
+                        # update() skips post_save, so expire the cached plan lists explicitly
+                        transaction.on_commit(bump_storage_plan_list_version)
+                invalidate_dashboard_stats(investment.user_id)
                 
                 return Response({'status': 'success'})
                 
@@ -272,31 +395,48 @@ def verify_payment(request):
         return Response({'error': 'Reference is required'}, status=400)
     
     try:
-        payment_transaction = PaymentTransaction.objects.get(reference=reference)
+        payment_transaction = PaymentTransaction.objects.select_related(
+            'investment__storage_plan'
+        ).get(reference=reference)
         payment_service = PaymentService()
         
         # Verify with payment gateway
         verification_result = payment_service.verify_payment(reference)
         
         if verification_result['status'] == 'success':
-            # Update payment and investment status
-            payment_transaction.status = 'successful'
-            payment_transaction.paid_at = datetime.now()
-            payment_transaction.save()
-            
-            investment = payment_transaction.investment
-            investment.status = 'active'
-            investment.payment_status = 'paid'
-            investment.payment_date = datetime.now()
-            investment.save()
-
-                # Create success notification/update
-            StorageUpdate.objects.create(
-                investment=investment,
-                update_type='storage_start',
-                title='Payment Confirmed - Storage Started',
-                message=f'Your payment of ₦{payment_transaction.amount:,.2f} has been confirmed. Your {investment.product_name} storage has officially started.'
-            )
+            with transaction.atomic():
+                # Re-read under lock; the webhook may have applied this payment meanwhile
+                payment_transaction = PaymentTransaction.objects.select_for_update(
+                    of=('self',)
+                ).select_related('investment__storage_plan').get(pk=payment_transaction.pk)
+                investment = payment_transaction.investment
+
+                if payment_transaction.status != 'successful':
+                    # Update payment and investment status with targeted UPDATEs
+                    PaymentTransaction.objects.filter(pk=payment_transaction.pk).update(
+                        status='successful',
+                        paid_at=Now(),
+                        updated_at=Now()
+                    )
+                    StorageInvestment.objects.filter(pk=investment.pk).update(
+                        status=paid_investment_status(),
+                        payment_status='paid',
+                        payment_date=Now(),
+                        updated_at=Now()
+                    )
+
+                    # Create success notification/update once the lock is released
+                    transaction.on_commit(partial(
+                        create_storage_update,
+                        investment.pk,
+                        'storage_start',
+                        'Payment Confirmed - Storage Started',
+                        f'Your payment of ₦{payment_transaction.amount:,.2f} has been confirmed. Your {investment.product_name} storage has officially started.'
+                    ))
+
+                    # Reload just the changed columns for the serialized response
+                    investment.refresh_from_db(fields=['status', 'payment_status', 'payment_date', 'updated_at'])
+            invalidate_dashboard_stats(investment.user_id)
             
             
             return Response({
@@ -334,10 +474,13 @@ def register_user(request):
             'error': 'Username, email, and password are required'
         }, status=400)
     
-    if User.objects.filter(username=username).exists():
-        return Response({'error': 'Username already exists'}, status=400)
-    
-    if User.objects.filter(email=email).exists():
+    # One probe for both unique fields; report whichever one is taken
+    existing = User.objects.filter(
+        Q(username=username) | Q(email=email)
+    ).values_list('username', 'email').first()
+    if existing:
+        if existing[0] == username:
+            return Response({'error': 'Username already exists'}, status=400)
         return Response({'error': 'Email already exists'}, status=400)
     
     try:
@@ -361,6 +504,9 @@ def register_user(request):
             }
         }, status=201)
     
+    except IntegrityError:
+        # Lost a race with a concurrent registration for the same username/email
+        return Response({'error': 'Username or email already exists'}, status=400)
     except Exception as e:
         return Response({'error': str(e)}, status=500)
 
@@ -382,11 +528,14 @@ def login_user(request):
     if user:
         # Create or get token (you'll need to install djangorestframework-authtoken)
         from rest_framework.authtoken.models import Token
-        token, created = Token.objects.get_or_create(user=user)
+        # Returning users already have a token: read just the key column
+        key = Token.objects.filter(user_id=user.id).values_list('key', flat=True).first()
+        if key is None:
+            key = Token.objects.create(user=user).key
         
         return Response({
             'success': True,
-            'token': token.key,
+            'token': key,
             'user': {
                 'id': user.id,
                 'username': user.username,
@@ -405,34 +554,39 @@ def login_user(request):
 @permission_classes([IsAuthenticated])
 def mature_investment(request, investment_id):
     try:
-        investment = StorageInvestment.objects.get(
+        # Conditional UPDATE: only an active, due investment matches, so concurrent requests mature it once
+        updated = StorageInvestment.objects.filter(
+            id=investment_id,
+            user=request.user,
+            status='active',
+            due_date__lte=date.today()
+        ).update(status='matured', matured_date=Now(), updated_at=Now())
+        
+        investment = StorageInvestment.objects.select_related('storage_plan').get(
             id=investment_id,
             user=request.user
         )
         
-        # Validate investment can be matured
-        if investment.status == 'matured':
-            return Response({
-                'success': False,
-                'message': 'Investment is already matured'
-            }, status=400)
-            
-        if investment.status != 'active':
-            return Response({
-                'success': False,
-                'message': 'Only active investments can be matured'
-            }, status=400)
-            
-        if date.today() < investment.due_date:
+        # Nothing matched: report which precondition failed
+        if not updated:
+            if investment.status == 'matured':
+                return Response({
+                    'success': False,
+                    'message': 'Investment is already matured'
+                }, status=400)
+                
+            if investment.status != 'active':
+                return Response({
+                    'success': False,
+                    'message': 'Only active investments can be matured'
+                }, status=400)
+                
             return Response({
                 'success': False,
                 'message': 'Investment is not yet due for maturation'
             }, status=400)
         
-        # Update investment status to matured
-        investment.status = 'matured'
-        investment.matured_date = datetime.now()  # Add this field to your model if needed
-        investment.save()
+        invalidate_dashboard_stats(investment.user_id)
         
         # Create maturation update
         StorageUpdate.objects.create(